@@ -31,6 +31,11 @@ def create_app(config_name):
 
     db.init_app(app)
 
+    if app.config["SQL_INSTRUMENTATION"]:
+        from . import instrumentation
+
+        instrumentation.init_app(app)
+
     if app.config["STRICT_SECURITY"]:
         from flask_talisman import Talisman
 
@@ -55,4 +60,11 @@ def create_app(config_name):
 
     app.register_blueprint(cli_bp, cli_group=None)
 
+    # The benchmarks can drop every table, so they are left out unless they
+    # are asked for
+    if app.config["BENCHMARKS"]:
+        from .benchmarks import bench_bp
+
+        app.register_blueprint(bench_bp, cli_group=None)
+
     return app
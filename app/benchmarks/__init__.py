@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+bench_bp = Blueprint("bench", __name__)
+
+from . import commands
@@ -0,0 +1,608 @@
+import json
+import os
+import random
+import tempfile
+from contextlib import redirect_stdout
+
+import click
+from flask import current_app, g
+from flask.cli import with_appcontext
+
+from .. import db
+from ..cli import update_specials
+from ..criteria import (
+    CriteriaIndex,
+    ImportantCriteria,
+    SpecialColumns,
+    compiled_criteria_cache,
+)
+from ..models import Status, UpdateRun
+from ..parsers import (
+    DVCRentalPointParser,
+    DVCRentalPreconfirmParser,
+    DVCRentalStoreConfirmed2021,
+)
+from ..parsers.base_parser import collect_specials
+from ..util import SpecialTypes
+from . import bench_bp
+from .fakes import fake_notifications
+from .measure import (
+    best_time,
+    format_bytes,
+    traced_allocations,
+    traced_memory,
+)
+from .seed import add_users, require_scratch_database, reset_database
+from .synthetic import (
+    characteristic_ids,
+    churned_reservations,
+    confirmed_reservations,
+    confirmed_reservations_page,
+    important_criteria,
+    knack_pages,
+    knack_points_records,
+    knack_preconfirm_records,
+    stored_specials,
+)
+
+SCENARIOS = ("unchanged", "churn", "turnover")
+BENCH_PARSERS = (
+    DVCRentalStoreConfirmed2021,
+    DVCRentalPointParser,
+    DVCRentalPreconfirmParser,
+)
+
+
+@bench_bp.cli.command(
+    help="Time and measure the memory of parsing a synthetic confirmed reservations page into ParsedSpecials."
+)
+@click.option(
+    "-n",
+    "--count",
+    default=20000,
+    show_default=True,
+    help="Number of reservations on the page.",
+)
+@click.option(
+    "-r",
+    "--repeat",
+    default=3,
+    show_default=True,
+    help="Number of times to run each timing, the fastest is reported.",
+)
+@click.option(
+    "--generated-ids",
+    is_flag=True,
+    help="Leave the 'id' out of the reservations so every special_id has to be made from the raw data.",
+)
+@with_appcontext
+def bench_parsed_specials(count, repeat, generated_ids):
+    reservations = confirmed_reservations(count)
+    if generated_ids:
+        for reservation in reservations:
+            del reservation["id"]
+    page = confirmed_reservations_page(reservations)
+    dvc_parser = DVCRentalStoreConfirmed2021()
+
+    def parse_page():
+        return collect_specials(dvc_parser.process_specials_content(page))
+
+    def parse_reservations():
+        return list(dvc_parser.process_specials_list(reservations))
+
+    parse_seconds, specials = best_time(parse_page, repeat)
+    print(
+        f"Parsed {len(specials)} specials from a {format_bytes(len(page))} page"
+    )
+    print(
+        f"  parse page:          {parse_seconds:.3f}s "
+        f"({len(specials) / parse_seconds:,.0f} specials/s)"
+    )
+
+    # The pipeline reads 'special_id' a handful of times for every special
+    # (collecting, diffing, error handling), so read it a few times each here.
+    special_list = list(specials.values())
+
+    def read_special_ids():
+        for parsed_special in special_list:
+            for _ in range(4):
+                parsed_special.special_id
+
+    id_seconds, _ = best_time(read_special_ids, repeat)
+    print(f"  read special_id x4:  {id_seconds:.3f}s")
+
+    # The reservations are already decoded, so what is left over is only
+    # what the ParsedSpecials themselves hold on to.
+    parsed_specials, retained, peak = traced_memory(parse_reservations)
+    print(
+        f"  retained memory:     {format_bytes(retained)} "
+        f"({retained / len(parsed_specials):,.0f} B/special)"
+    )
+    print(f"  peak memory:         {format_bytes(peak)}")
+
+
+@bench_bp.cli.command(
+    help=(
+        "Run update-specials over synthetic specials, with fake Mailgun, "
+        "Twilio and APNs clients, and report the timings and memory of each "
+        "stage. EVERY TABLE IN THE DATABASE IS DROPPED, only run this "
+        "against a scratch database (DATABASE_URL and BENCH_DATABASE_URL must "
+        "be the same, i.e. both sqlite:///bench.db)."
+    )
+)
+@click.option(
+    "-n",
+    "--count",
+    type=int,
+    multiple=True,
+    default=(1000,),
+    show_default=True,
+    help="Number of specials, can be given more than once (i.e. -n 1000 -n 10000 -n 50000).",
+)
+@click.option(
+    "-u",
+    "--users",
+    default=100,
+    show_default=True,
+    help="Number of users, each with important criteria and contacts.",
+)
+@click.option(
+    "-s",
+    "--scenario",
+    type=click.Choice(SCENARIOS),
+    multiple=True,
+    default=SCENARIOS,
+    help="Scenario to run, can be given more than once. The default is all of them.",
+)
+@click.option(
+    "--churn",
+    default=0.05,
+    show_default=True,
+    help="Fraction of the specials that change in the 'churn' scenario.",
+)
+@click.option(
+    "-r",
+    "--repeat",
+    default=1,
+    show_default=True,
+    help="Number of times to run each scenario, the fastest run is reported.",
+)
+@click.option(
+    "--memory/--no-memory",
+    default=True,
+    show_default=True,
+    help="Run each scenario once more while tracing memory allocations.",
+)
+@click.option(
+    "--seed",
+    default=0,
+    show_default=True,
+    help="Seed for the synthetic data, the same seed always makes the same data.",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False),
+    help="Save the results as JSON, to use with --compare later.",
+)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Show the change from the results saved by an earlier --output.",
+)
+@click.confirmation_option(
+    prompt="This drops every table in the database, are you sure?"
+)
+@with_appcontext
+def bench_update(
+    count, users, scenario, churn, repeat, memory, seed, output, compare
+):
+    require_scratch_database()
+    app = current_app._get_current_object()
+    # The queries each run makes are part of the results
+    app.config["SQL_INSTRUMENTATION"] = True
+    static_data_path = app.config["STATIC_DATA_PATH"]
+    previous = {}
+    if compare:
+        with open(compare) as f:
+            previous = json.load(f)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        for special_count in count:
+            print(f"{special_count:,} specials, {users:,} users")
+            bench_knack_parsers(special_count, data_dir, seed)
+
+            reservations = confirmed_reservations(special_count, seed)
+            scenario_reservations = {
+                "unchanged": reservations,
+                "churn": churned_reservations(reservations, churn, seed),
+                "turnover": confirmed_reservations(
+                    special_count, seed + 2, first_id=special_count * 2
+                ),
+            }
+            base_path = write_confirmed_page(data_dir, "base", reservations)
+
+            for name in scenario:
+                path = write_confirmed_page(
+                    data_dir, name, scenario_reservations[name]
+                )
+
+                def set_up():
+                    # Every run starts from the same stored specials
+                    reset_database(static_data_path)
+                    add_users(users, seed)
+                    run_update(base_path, send_email=False)
+
+                with fake_notifications(app) as fakes:
+                    runs = []
+                    for _ in range(max(1, repeat)):
+                        set_up()
+                        runs.append(run_update(path))
+                    result = min(runs, key=lambda run: run["duration"])
+                    if memory:
+                        set_up()
+                        _, _, result["peak_memory"] = traced_memory(
+                            lambda: run_update(path)
+                        )
+                if fakes.errors_sent:
+                    print(
+                        f"  Warning: {fakes.errors_sent} error messages were "
+                        f"sent during '{name}', the timings include them."
+                    )
+                result["sent"] = dict(fakes.sent)
+
+                key = f"{special_count}.{name}"
+                results[key] = result
+                print_update_result(name, result, previous.get(key))
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to '{output}'")
+
+
+def write_confirmed_page(data_dir, name, reservations):
+    # The file name is how 'update-specials' knows which parser it is for
+    path = os.path.join(
+        data_dir, name, f"{DVCRentalStoreConfirmed2021().source}.html"
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(confirmed_reservations_page(reservations))
+    return path
+
+
+def run_update(path, send_email=True):
+    """
+    Runs 'update-specials' with the page at 'path' and returns the metrics
+    it recorded. It is forced, otherwise an unchanged page would be skipped
+    before it is compared to the stored specials.
+    """
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        update_specials((path,), send_email, False, force=True)
+    if not Status.default.healthy:
+        print("  Warning: the update was not healthy, see 'status'.")
+    update_run = db.session.get(UpdateRun, g.run_id)
+    return {
+        "duration": update_run.duration,
+        "stages": update_run.stage_durations,
+        "new": update_run.new_count,
+        "updated": update_run.updated_count,
+        "removed": update_run.removed_count,
+        "errors": update_run.error_count,
+        "queries": update_run.query_count,
+        "db_seconds": update_run.db_seconds,
+    }
+
+
+def bench_knack_parsers(count, data_dir, seed):
+    """
+    The Knack parsers aren't in PARSERS, so 'update-specials' doesn't use
+    them. Only their parsing is timed, over pages the way 'store-specials-data'
+    saves them.
+    """
+    for Parser, records in (
+        (DVCRentalPointParser, knack_points_records(count, seed)),
+        (DVCRentalPreconfirmParser, knack_preconfirm_records(count, seed)),
+    ):
+        dvc_parser = Parser()
+        path = os.path.join(data_dir, f"{dvc_parser.source}.json")
+        with open(path, "w") as f:
+            json.dump(knack_pages(records), f)
+
+        def parse():
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                pages = dvc_parser.get_local_specials_page(path)
+            return collect_specials(dvc_parser.process_specials_content(pages))
+
+        seconds, specials = best_time(parse)
+        print(
+            f"  parse {dvc_parser.source:<36}{seconds:>9.3f}s "
+            f"({len(specials) / seconds:,.0f} specials/s)"
+        )
+
+
+def print_update_result(name, result, previous=None):
+    def change(key, stage=None):
+        if previous is None:
+            return ""
+        before = (
+            previous.get(key)
+            if stage is None
+            else previous.get("stages", {}).get(stage)
+        )
+        after = result[key] if stage is None else result["stages"][stage]
+        if not before:
+            return ""
+        return f" ({(after - before) / before:+.0%})"
+
+    print(
+        f"  {name}: {result['duration']:.3f}s{change('duration')}, "
+        f"{result['queries']} queries taking {result['db_seconds']:.3f}s, "
+        f"{result['new']} new, {result['updated']} updated, "
+        f"{result['removed']} removed"
+    )
+    if "peak_memory" in result:
+        print(
+            f"    peak memory: {format_bytes(result['peak_memory'])}"
+            f"{change('peak_memory')}"
+        )
+    for stage, seconds in sorted(
+        result["stages"].items(), key=lambda item: item[1], reverse=True
+    ):
+        print(f"    {stage:<40}{seconds:>9.3f}s{change('stages', stage)}")
+
+
+@bench_bp.cli.command(
+    help=(
+        "Time parser NAME over FILE (i.e. saved by store-specials-data). Only "
+        "the specials are extracted and processed, nothing is stored. The "
+        "time of each field in the parser's 'parse_fields' is shown too."
+    )
+)
+@click.argument("name")
+@click.argument(
+    "file", required=False, type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    "-n",
+    "--synthetic",
+    type=int,
+    help="Parse this many synthetic specials instead of FILE.",
+)
+@click.option(
+    "-r",
+    "--repeat",
+    default=5,
+    show_default=True,
+    help="Number of times to run each timing, the fastest is reported.",
+)
+@click.option(
+    "--seed",
+    default=0,
+    show_default=True,
+    help="Seed for the synthetic specials.",
+)
+@with_appcontext
+def bench_parser(name, file, synthetic, repeat, seed):
+    parsers = [Parser() for Parser in BENCH_PARSERS]
+    dvc_parser = next(
+        (dvc_parser for dvc_parser in parsers if dvc_parser.source == name),
+        None,
+    )
+    if dvc_parser is None:
+        print(f"No parser with the name '{name}' was found.")
+        return
+    if file is None and synthetic is None:
+        raise click.UsageError("Either FILE or --synthetic is needed.")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        if synthetic is not None:
+            file = write_synthetic_payload(
+                dvc_parser, synthetic, data_dir, seed
+            )
+
+        def load():
+            return dvc_parser.get_local_specials_page(file)
+
+        def parse():
+            return collect_specials(dvc_parser.process_specials_content(load()))
+
+        # The parsers print where they are reading from every time
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            extract_seconds, records = best_time(
+                lambda: list(dvc_parser.get_specials_list(load())), repeat
+            )
+            process_seconds, _ = best_time(
+                lambda: collect_specials(
+                    dvc_parser.process_specials_list(records)
+                ),
+                repeat,
+            )
+            total_seconds, specials = best_time(parse, repeat)
+            _, blocks, retained, peak = traced_allocations(parse)
+
+    if not records:
+        print(f"No specials were found in '{file}'.")
+        return
+    error_count = sum(1 for special in specials.values() if special.errors)
+    per_record = 1_000_000 / len(records)
+    print(
+        f"{dvc_parser.source}: {len(records):,} records, "
+        f"{len(specials):,} specials, {error_count:,} with errors"
+    )
+    print(
+        f"  total:   {total_seconds:.3f}s "
+        f"({len(records) / total_seconds:,.0f} records/s)"
+    )
+    print(
+        f"  extract: {extract_seconds:.3f}s "
+        f"({extract_seconds * per_record:.1f}us/record)"
+    )
+    print(
+        f"  process: {process_seconds:.3f}s "
+        f"({process_seconds * per_record:.1f}us/record)"
+    )
+
+    fields_seconds = 0
+    for field, func in dvc_parser.parse_fields.items():
+
+        def extract_field():
+            for record in records:
+                func(dvc_parser, record)
+                dvc_parser.pop_current_error()
+
+        field_seconds, _ = best_time(extract_field, repeat)
+        fields_seconds += field_seconds
+        print(
+            f"    {field:<20}{field_seconds * per_record:>8.2f}us/record "
+            f"({field_seconds / process_seconds:.0%})"
+        )
+    other_seconds = max(0, process_seconds - fields_seconds)
+    print(
+        f"    {'(everything else)':<20}{other_seconds * per_record:>8.2f}"
+        f"us/record ({other_seconds / process_seconds:.0%})"
+    )
+
+    print(
+        f"  still allocated: {blocks / len(records):,.1f} blocks/record, "
+        f"{format_bytes(retained / len(records))}/record"
+    )
+    print(f"  peak memory:     {format_bytes(peak)}")
+
+
+def write_synthetic_payload(dvc_parser, count, data_dir, seed=0):
+    """
+    Writes a synthetic payload with 'count' specials for 'dvc_parser', in the
+    same format 'store-specials-data' saves it, and returns its path.
+    """
+    if isinstance(dvc_parser, DVCRentalStoreConfirmed2021):
+        return write_confirmed_page(
+            data_dir, "synthetic", confirmed_reservations(count, seed)
+        )
+    if isinstance(dvc_parser, DVCRentalPointParser):
+        records = knack_points_records(count, seed)
+    else:
+        records = knack_preconfirm_records(count, seed)
+    path = os.path.join(data_dir, f"{dvc_parser.source}.json")
+    with open(path, "w") as f:
+        json.dump(knack_pages(records), f)
+    return path
+
+
+@bench_bp.cli.command(
+    help="Time matching synthetic specials against synthetic users' important criteria."
+)
+@click.option(
+    "-n",
+    "--count",
+    default=10000,
+    show_default=True,
+    help="Number of specials.",
+)
+@click.option(
+    "-b",
+    "--blocks",
+    default=100,
+    show_default=True,
+    help="Number of criteria blocks, spread over as many users as it takes.",
+)
+@click.option(
+    "-r",
+    "--repeat",
+    default=3,
+    show_default=True,
+    help="Number of times to run each timing, the fastest is reported.",
+)
+@click.option(
+    "--seed",
+    default=0,
+    show_default=True,
+    help="Seed for the synthetic data.",
+)
+@with_appcontext
+def bench_criteria(count, blocks, repeat, seed):
+    ids = characteristic_ids(current_app.config["STATIC_DATA_PATH"])
+    specials = stored_specials(count, *ids, seed=seed)
+
+    rng = random.Random(seed)
+    criteria_list = []
+    block_count = 0
+    while block_count < blocks:
+        criteria = important_criteria(rng, *ids)
+        criteria = {
+            SpecialTypes(key) if key != "important_only" else key: value
+            for key, value in criteria.items()
+        }
+        block_count += sum(
+            len(criteria.get(special_type, [])) for special_type in SpecialTypes
+        )
+        criteria_list.append(criteria)
+    print(
+        f"{len(specials):,} specials, {block_count:,} criteria blocks "
+        f"({len(criteria_list):,} users)"
+    )
+
+    def compile_all():
+        compiled_criteria_cache.clear()
+        all_criteria = [
+            ImportantCriteria(criteria) for criteria in criteria_list
+        ]
+        for user_criteria in all_criteria:
+            user_criteria.compiled_criteria
+        return all_criteria
+
+    def match(check):
+        return [
+            [check(user_criteria, special) for special in specials]
+            for user_criteria in all_criteria
+        ]
+
+    def match_index():
+        criteria_index = CriteriaIndex(dict(enumerate(all_criteria)))
+        return criteria_index.match_all(specials)
+
+    def match_columns():
+        columns = SpecialColumns(specials)
+        important_masks = columns.important_masks(dict(enumerate(all_criteria)))
+        return [
+            columns.flags(important_masks[i]) for i in range(len(all_criteria))
+        ]
+
+    compile_seconds, all_criteria = best_time(compile_all, repeat)
+    scalar_seconds, scalar = best_time(
+        lambda: match(ImportantCriteria.check_special), repeat
+    )
+    compiled_seconds, compiled = best_time(
+        lambda: match(ImportantCriteria.is_important_special), repeat
+    )
+    index_seconds, index_matches = best_time(match_index, repeat)
+    columns_seconds, columnar = best_time(match_columns, repeat)
+    indexed = []
+    for i in range(len(all_criteria)):
+        important_ids = {special.special_id for special in index_matches[i]}
+        indexed.append(
+            [special.special_id in important_ids for special in specials]
+        )
+
+    evaluations = len(specials) * block_count
+    print(f"  compile:  {compile_seconds * 1000:.2f}ms")
+    for name, seconds, results in (
+        ("scalar", scalar_seconds, scalar),
+        ("compiled", compiled_seconds, compiled),
+        ("index", index_seconds, indexed),
+        ("columnar", columns_seconds, columnar),
+    ):
+        print(
+            f"  {name + ':':<10}{seconds:.3f}s "
+            f"({evaluations / seconds:,.0f} special x block/s, "
+            f"{scalar_seconds / seconds:.1f}x)"
+        )
+        mismatches = sum(
+            scalar_important != important
+            for scalar_row, row in zip(scalar, results)
+            for scalar_important, important in zip(scalar_row, row)
+        )
+        if mismatches:
+            print(f"  Warning: {mismatches:,} results were different!")
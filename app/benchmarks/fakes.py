@@ -0,0 +1,99 @@
+from collections import Counter
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from ..notifications.send import apns, emails, text_messages
+
+
+class FakeNotifications:
+    """
+    Stands in for Mailgun, Twilio and APNs. Nothing is sent anywhere, every
+    message is only counted (by service and whether it was an error message).
+    Everything up to the request itself (rendering, inlining the css, making
+    the payloads) still happens, so it is still part of the timings.
+    """
+
+    def __init__(self):
+        self.sent = Counter()
+
+    def mailgun_post(self, url, auth=None, data=None):
+        kind = "error" if "Error" in data["subject"] else "update"
+        self.sent[f"email.{kind}"] += len(data["to"])
+        return SimpleNamespace(
+            status_code=200, reason="OK", json=lambda: {"id": "<bench>"}
+        )
+
+    def twilio_client(self, account_sid, auth_token):
+        def create(messaging_service_sid, body, to):
+            kind = "error" if "problem" in body else "update"
+            self.sent[f"text.{kind}"] += 1
+
+        return SimpleNamespace(messages=SimpleNamespace(create=create))
+
+    def apns_client(self, credentials, use_sandbox, use_alternative_port):
+        def send_notification_batch(notifications, topic):
+            results = []
+            for notification in notifications:
+                alert = notification.payload.alert
+                kind = "error" if "problem" in alert else "update"
+                self.sent[f"push.{kind}"] += 1
+                results.append(
+                    SimpleNamespace(
+                        token=notification.token, success=True, error=None
+                    )
+                )
+            return results
+
+        return SimpleNamespace(send_notification_batch=send_notification_batch)
+
+    @property
+    def errors_sent(self):
+        return sum(
+            count for key, count in self.sent.items() if key.endswith("error")
+        )
+
+
+@contextmanager
+def fake_notifications(app):
+    """
+    Replaces the Mailgun, Twilio and APNs clients with a FakeNotifications
+    (which is what is yielded) inside the 'with' block. The app's config is
+    given fake keys, otherwise nothing would be "sent" at all.
+    """
+    fakes = FakeNotifications()
+    patches = [
+        (
+            emails,
+            "requests",
+            SimpleNamespace(
+                post=fakes.mailgun_post, codes=emails.requests.codes
+            ),
+        ),
+        (text_messages, "Client", fakes.twilio_client),
+        (apns, "APNsClient", fakes.apns_client),
+        (apns, "TokenCredentials", lambda **kwargs: None),
+    ]
+    config = {
+        "MAILGUN_API_KEY": "bench",
+        "MAILGUN_DOMAIN_NAME": "bench.invalid",
+        "TWILIO_SID": "bench",
+        "TWILIO_TOKEN": "bench",
+        "TWILIO_MSG_SRVC": "bench",
+        "APNS_KEY_ID": "bench",
+        "APNS_TEAM_ID": "bench",
+        "APNS_AUTH_KEY": "bench",
+        "APNS_TOPIC": "bench",
+    }
+    originals = [
+        (module, name, getattr(module, name)) for module, name, _ in patches
+    ]
+    original_config = {key: app.config.get(key) for key in config}
+    for module, name, fake in patches:
+        setattr(module, name, fake)
+    app.config.update(config)
+    try:
+        yield fakes
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+        app.config.update(original_config)
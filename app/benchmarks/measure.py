@@ -0,0 +1,66 @@
+import gc
+import time
+import tracemalloc
+
+
+def best_time(func, repeat=1):
+    """
+    Calls 'func' 'repeat' times and returns the fastest time, in seconds,
+    along with what the last call returned. The garbage collector is run
+    before each call so garbage from one call isn't collected during the next.
+    """
+    best = None
+    result = None
+    for _ in range(max(1, repeat)):
+        result = None
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def traced_memory(func):
+    """
+    Calls 'func' while tracing allocations. Returns what it returned along
+    with the bytes still allocated when it finished (which is what the result
+    is holding on to) and the peak bytes allocated during the call.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def traced_allocations(func):
+    """
+    The same as 'traced_memory', but also counts the memory blocks that are
+    still allocated when 'func' finished. Returns (result, blocks, current,
+    peak).
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    return result, blocks, current, peak
+
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
@@ -0,0 +1,86 @@
+import random
+
+import click
+from flask import current_app
+
+from .. import db
+from ..models import (
+    APN,
+    Email,
+    Phone,
+    Resort,
+    ResortCategory,
+    Room,
+    RoomCategory,
+    User,
+    View,
+    ViewCategory,
+)
+from .synthetic import important_criteria
+
+
+def require_scratch_database():
+    """
+    Stops the command unless the app's database is the scratch database in
+    'BENCH_DATABASE_URL', so the tables of a real database are never dropped.
+    """
+    bench_database_url = current_app.config["BENCH_DATABASE_URL"]
+    if (
+        not bench_database_url
+        or bench_database_url != current_app.config["SQLALCHEMY_DATABASE_URI"]
+    ):
+        raise click.ClickException(
+            "This drops every table in the database, it only runs when "
+            "DATABASE_URL is the same as BENCH_DATABASE_URL (i.e. both are "
+            "sqlite:///bench.db)."
+        )
+
+
+def reset_database(static_data_path):
+    """
+    Drops and recreates every table, then loads the static data into them.
+    """
+    require_scratch_database()
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    for Model in (
+        ResortCategory,
+        RoomCategory,
+        ViewCategory,
+        Resort,
+        Room,
+        View,
+    ):
+        Model.insert_data_from(static_data_path)
+
+
+def add_users(count, seed=0):
+    """
+    Adds 'count' users, each with 'important_criteria' (see
+    'synthetic.important_criteria') and one or two email addresses. Some of
+    them also have a phone number or a push token. The password is not hashed
+    since nobody is going to sign in with it.
+    """
+    rng = random.Random(seed)
+    resort_ids = db.session.scalars(db.select(Resort.characteristic_id)).all()
+    room_ids = db.session.scalars(db.select(Room.characteristic_id)).all()
+    view_ids = db.session.scalars(db.select(View.characteristic_id)).all()
+    for i in range(count):
+        user = User(
+            username=f"bench{i}",
+            password_hash="bench",
+            important_criteria=important_criteria(
+                rng, resort_ids, room_ids, view_ids
+            ),
+        )
+        user.emails = [
+            Email(email_address=f"bench{i}.{j}@bench.invalid")
+            for j in range(rng.randrange(1, 3))
+        ]
+        if rng.random() < 0.5:
+            user.phones = [Phone(phone_number=f"+1555{i:07d}")]
+        if rng.random() < 0.3:
+            user.apns = [APN(push_token=f"{i:064x}")]
+        db.session.add(user)
+    db.session.commit()
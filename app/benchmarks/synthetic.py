@@ -0,0 +1,283 @@
+import json
+import random
+from datetime import date, timedelta
+
+import tomlkit
+
+from ..models import Resort, Room, StoredSpecial, View
+from ..parsers import DVCRentalStoreConfirmed2021
+from ..util import SpecialTypes
+
+
+def confirmed_reservations(count, seed=0, first_id=0):
+    """
+    Makes a list of reservations that look like the ones on the DVC Rental
+    Store confirmed reservations page. The resorts, rooms and views are all
+    taken from the parser map so every reservation can be parsed. The same
+    seed always makes the same reservations. Their ids start at 'first_id'
+    (offset so they look like the real ones).
+    """
+    rng = random.Random(seed)
+    parser_map = DVCRentalStoreConfirmed2021().parser_map
+    resort_keys = list(parser_map["resorts"]["values"])
+    room_types = list(parser_map["rooms"]["values"])
+    view_keys = [
+        key
+        for key, value in parser_map["views"]["values"].items()
+        if isinstance(value, str)
+    ]
+    first_check_in = date.today() + timedelta(days=30)
+
+    reservations = []
+    for i in range(first_id, first_id + count):
+        check_in = first_check_in + timedelta(days=rng.randrange(365))
+        check_out = check_in + timedelta(days=rng.randrange(2, 8))
+        reservations.append(
+            {
+                "id": str(100000 + i),
+                "reservation_number": 500000 + i,
+                "price": f"{rng.randrange(500, 8000)}.00",
+                "points": rng.randrange(30, 400),
+                "raw_check_in": f"{check_in.isoformat()}T00:00:00Z",
+                "raw_check_out": f"{check_out.isoformat()}T00:00:00Z",
+                "resort_key": rng.choice(resort_keys),
+                "room_type": rng.choice(room_types),
+                "room_view_key": rng.choice(view_keys),
+                "room_view": "",
+            }
+        )
+    return reservations
+
+
+def confirmed_reservations_page(reservations):
+    """
+    Wraps the reservations in enough html, the same way the real page does,
+    for 'DVCRentalStoreConfirmed2021' to find them.
+    """
+    return (
+        "<!DOCTYPE html>\n<html>\n<head>\n"
+        '<script type="text/javascript" id="dvcrs-reservations-reactjs-js-before">\n'
+        'var dvcrs_settings = {"currency": "USD"};\n'
+        f"var all_reservations = {json.dumps(reservations)};\n"
+        "</script>\n</head>\n<body></body>\n</html>\n"
+    )
+
+
+def churned_reservations(reservations, churn, seed=0):
+    """
+    Returns a copy of 'reservations' where 'churn' (a fraction) of them have
+    changed: half of those get a new price, a quarter are removed and as many
+    new reservations are added as were removed.
+    """
+    rng = random.Random(seed)
+    changed = round(len(reservations) * churn)
+    indexes = rng.sample(range(len(reservations)), changed)
+    updated = set(indexes[: changed // 2])
+    removed = set(indexes[changed // 2 : changed // 2 + changed // 4])
+
+    churned = []
+    for i, reservation in enumerate(reservations):
+        if i in removed:
+            continue
+        if i in updated:
+            reservation = reservation | {
+                "price": f"{rng.randrange(500, 8000)}.00"
+            }
+        churned.append(reservation)
+    churned.extend(
+        confirmed_reservations(
+            len(removed), seed=seed + 1, first_id=len(reservations)
+        )
+    )
+    return churned
+
+
+def knack_points_records(count, seed=0):
+    """
+    Makes records that look like the ones from the discounted points Knack
+    endpoint ('DVCRentalPointParser').
+    """
+    rng = random.Random(seed)
+    first_check_out = date.today() + timedelta(days=30)
+    records = []
+    for i in range(count):
+        check_out = first_check_out + timedelta(days=rng.randrange(365))
+        records.append(
+            {
+                "id": f"{i:024x}",
+                "field_203_raw": 700000 + i,
+                "field_154_raw": rng.randrange(10, 300),
+                "field_193_raw": f"{rng.randrange(10, 25)}.00",
+                "field_336_raw": {
+                    "iso_timestamp": f"{check_out.isoformat()}T00:00:00.000Z"
+                },
+            }
+        )
+    return records
+
+
+def knack_preconfirm_records(count, seed=0):
+    """
+    Makes records that look like the ones from the preconfirmed reservations
+    Knack endpoint ('DVCRentalPreconfirmParser').
+    """
+    rng = random.Random(seed)
+    resorts = (
+        "Bay Lake Tower",
+        "Beach Club Villas",
+        "Boulder Ridge Villas",
+        "Grand Floridian Villas",
+        "Polynesian Villas",
+        "Riviera Resort",
+        "Saratoga Springs",
+    )
+    rooms = ("Studio", "1 Bedroom", "2 Bedroom", "3 Bedroom Grand")
+    views = ("", "Standard", "Preferred", "Lake", "Theme Park")
+    first_check_in = date.today() + timedelta(days=30)
+    records = []
+    for i in range(count):
+        check_in = first_check_in + timedelta(days=rng.randrange(365))
+        check_out = check_in + timedelta(days=rng.randrange(2, 8))
+        view = rng.choice(views)
+        records.append(
+            {
+                "id": f"{i:024x}",
+                "field_56_raw": 800000 + i,
+                "field_78_raw": f"{rng.randrange(500, 8000):,}.00",
+                "field_10_raw": {
+                    "iso_timestamp": f"{check_in.isoformat()}T00:00:00.000Z"
+                },
+                "field_11_raw": {
+                    "iso_timestamp": f"{check_out.isoformat()}T00:00:00.000Z"
+                },
+                "field_57_raw": [{"identifier": rng.choice(resorts)}],
+                "field_145_raw": [{"identifier": rng.choice(rooms)}],
+                "field_9_raw": [{"identifier": view}] if view else [],
+            }
+        )
+    return records
+
+
+def knack_pages(records, rows_per_page=100):
+    """
+    Splits 'records' into pages the same way the Knack 'records' endpoint
+    does. A list of the pages is what 'store-specials-data' saves for the
+    Knack parsers.
+    """
+    total_pages = max(1, -(-len(records) // rows_per_page))
+    return [
+        {
+            "total_pages": total_pages,
+            "current_page": page + 1,
+            "total_records": len(records),
+            "records": records[
+                page * rows_per_page : (page + 1) * rows_per_page
+            ],
+        }
+        for page in range(total_pages)
+    ]
+
+
+def important_criteria(rng, resort_ids, room_ids, view_ids):
+    """
+    Makes 'important_criteria' for a user, with one to four blocks of
+    preconfirmed criteria (each using a few of the criteria) and sometimes a
+    block of discounted points criteria.
+    """
+    first_day = date.today() + timedelta(days=30)
+    preconfirm = []
+    for _ in range(rng.randrange(1, 5)):
+        criteria = {}
+        if rng.random() < 0.8:
+            criteria["resorts"] = rng.sample(
+                resort_ids, rng.randrange(1, min(6, len(resort_ids)) + 1)
+            )
+        if rng.random() < 0.5:
+            criteria["rooms"] = rng.sample(
+                room_ids, rng.randrange(1, min(4, len(room_ids)) + 1)
+            )
+        if rng.random() < 0.2:
+            criteria["views"] = rng.sample(
+                view_ids, rng.randrange(1, min(3, len(view_ids)) + 1)
+            )
+        if rng.random() < 0.6:
+            start = first_day + timedelta(days=rng.randrange(365))
+            criteria["date"] = {
+                "start": start,
+                "end": start + timedelta(days=rng.randrange(7, 60)),
+            }
+        if rng.random() < 0.4:
+            criteria["length_of_stay"] = rng.randrange(2, 7)
+        if rng.random() < 0.3:
+            criteria["price"] = rng.randrange(15, 60) * 100
+        if rng.random() < 0.3:
+            criteria["price_per_night"] = rng.randrange(20, 90) * 10
+        if rng.random() < 0.3:
+            criteria["price_per_point"] = rng.randrange(12, 23)
+        preconfirm.append(criteria)
+
+    criteria = {"important_only": rng.random() < 0.7, "preconfirm": preconfirm}
+    if rng.random() < 0.2:
+        criteria["disc_points"] = [
+            {
+                "points": rng.randrange(20, 150),
+                "price_per_point": rng.randrange(12, 20),
+            }
+        ]
+    return criteria
+
+
+def characteristic_ids(static_data_path):
+    """
+    Returns lists of the resort, room and view ids in the static data.
+    """
+    with open(static_data_path, encoding="utf-8") as f:
+        data = tomlkit.loads(f.read())
+    return tuple(
+        [item[f"{name[:-1]}_id"] for item in data[name]]
+        for name in ("resorts", "rooms", "views")
+    )
+
+
+def stored_specials(count, resort_ids, room_ids, view_ids, seed=0):
+    """
+    Makes StoredSpecials (that aren't in the database) to check criteria
+    against. Most are preconfirmed reservations, some are discounted points
+    and a few are missing some of their values, the way specials with errors
+    are.
+    """
+    rng = random.Random(seed)
+    resorts = [Resort(resort_id=resort_id) for resort_id in resort_ids]
+    rooms = [Room(room_id=room_id) for room_id in room_ids]
+    views = [View(view_id=view_id) for view_id in view_ids]
+    first_check_in = date.today() + timedelta(days=30)
+
+    specials = []
+    for i in range(count):
+        check_in = first_check_in + timedelta(days=rng.randrange(365))
+        special = StoredSpecial(
+            special_id=str(100000 + i),
+            check_in=check_in,
+            check_out=check_in + timedelta(days=rng.randrange(2, 8)),
+        )
+        if rng.random() < 0.1:
+            special.type = SpecialTypes.DISC_POINTS
+            special.points = rng.randrange(10, 300)
+            special.price = rng.randrange(10, 25)
+            special.check_in = None
+        else:
+            special.type = SpecialTypes.PRECONFIRM
+            special.points = rng.randrange(30, 400)
+            special.price = rng.randrange(500, 8000)
+            special.set_core_value("resort", rng.choice(resorts))
+            special.set_core_value("room", rng.choice(rooms))
+            if rng.random() < 0.6:
+                special.set_core_value("view", rng.choice(views))
+        if rng.random() < 0.02:
+            setattr(
+                special,
+                rng.choice(("price", "points", "check_in", "check_out")),
+                None,
+            )
+        specials.append(special)
+    return specials
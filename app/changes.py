@@ -0,0 +1,171 @@
+from datetime import date
+from operator import attrgetter
+
+from . import db
+from .metrics import run_stage
+from .models import StoredSpecial
+
+
+class ChangeSet:
+    """
+    The differences between the specials from a parser and the specials that
+    are stored for it:
+        'added' - The ParsedSpecials that are not stored yet, by special_id.
+        'updated' - Tuples of (ParsedSpecial, StoredSpecial) for the specials
+                    that have changed.
+        'removed' - The StoredSpecials that the parser no longer has.
+        'errors' - The StoredSpecials that haven't changed but have an error,
+                   these are only needed for the error report.
+    """
+
+    def __init__(self):
+        self.added = {}
+        self.updated = []
+        self.removed = []
+        self.errors = []
+
+    def extend(self, other):
+        self.added.update(other.added)
+        self.updated.extend(other.updated)
+        self.removed.extend(other.removed)
+        self.errors.extend(other.errors)
+
+
+def query_stored_specials(source, batch_size=500):
+    """
+    Returns the special_id, fingerprint and error of the StoredSpecials for
+    'source', ordered by special_id the same way Python orders strings. They
+    are read in batches of 'batch_size' as they are iterated over, rather
+    than all at once. The StoredSpecials themselves are only loaded later for
+    the ones that might have changed (see 'diff_specials').
+    """
+    special_id = StoredSpecial.special_id
+    if db.session.get_bind().dialect.name == "postgresql":
+        # Otherwise the order depends on the database's locale
+        special_id = special_id.collate("C")
+    return db.session.execute(
+        db.select(
+            StoredSpecial.special_id,
+            StoredSpecial.fingerprint,
+            StoredSpecial.error,
+        )
+        .where(StoredSpecial.source == source)
+        .order_by(special_id)
+        .execution_options(yield_per=batch_size)
+    )
+
+
+def load_stored_specials(special_ids, batch_size=500):
+    """
+    Loads the StoredSpecials (along with their characteristics) for
+    'special_ids', in batches of 'batch_size' so the IN lists stay small.
+    Returns them in a dictionary by special_id.
+    """
+    special_ids = list(special_ids)
+    stored_specials = {}
+    for i in range(0, len(special_ids), batch_size):
+        for stored_special in db.session.scalars(
+            db.select(StoredSpecial).where(
+                StoredSpecial.special_id.in_(special_ids[i : i + batch_size])
+            )
+        ):
+            stored_specials[stored_special.special_id] = stored_special
+    return stored_specials
+
+
+def diff_specials(parsed_specials, stored_rows):
+    """
+    Finds the changes between 'parsed_specials', a dictionary of
+    ParsedSpecials by special_id, and 'stored_rows', an iterable of
+    (special_id, fingerprint, error) rows for the stored specials, ordered by
+    special_id (see 'query_stored_specials').
+
+    The parsed specials are sorted by special_id as well, so both can be
+    walked through together in one pass, only comparing fingerprints. After
+    that, the StoredSpecials are loaded only for the specials that were
+    removed, have an error, or whose fingerprint is different. The ones with
+    a different fingerprint are compared field by field to be sure they
+    changed.
+    """
+    changes = ChangeSet()
+    changed_ids = []
+    removed_ids = []
+    error_ids = []
+
+    parsed_iter = iter(
+        sorted(parsed_specials.values(), key=attrgetter("special_id"))
+    )
+    stored_iter = iter(stored_rows)
+    parsed_special = next(parsed_iter, None)
+    stored_row = next(stored_iter, None)
+    last_stored_id = None
+
+    with run_stage("diff"):
+        while parsed_special is not None or stored_row is not None:
+            if stored_row is None or (
+                parsed_special is not None
+                and parsed_special.special_id < stored_row.special_id
+            ):
+                changes.added[parsed_special.special_id] = parsed_special
+                parsed_special = next(parsed_iter, None)
+                continue
+
+            if (
+                last_stored_id is not None
+                and stored_row.special_id <= last_stored_id
+            ):
+                raise RuntimeError(
+                    "The stored specials must be ordered by special_id."
+                )
+
+            if (
+                parsed_special is None
+                or stored_row.special_id < parsed_special.special_id
+            ):
+                removed_ids.append(stored_row.special_id)
+            else:
+                if stored_row.fingerprint != parsed_special.fingerprint:
+                    changed_ids.append(stored_row.special_id)
+                elif stored_row.error:
+                    error_ids.append(stored_row.special_id)
+                parsed_special = next(parsed_iter, None)
+
+            last_stored_id = stored_row.special_id
+            stored_row = next(stored_iter, None)
+
+    with run_stage("load_stored"):
+        stored_specials = load_stored_specials(
+            changed_ids + removed_ids + error_ids
+        )
+
+    for special_id in changed_ids:
+        parsed_special = parsed_specials[special_id]
+        stored_special = stored_specials[special_id]
+        if stored_special != parsed_special:
+            changes.updated.append((parsed_special, stored_special))
+        else:
+            # The fingerprint is missing or out of date, i.e. after
+            # 'reset-errors', but nothing has actually changed
+            stored_special.update_fingerprint()
+            if stored_special.error:
+                changes.errors.append(stored_special)
+    changes.removed.extend(
+        stored_specials[special_id] for special_id in removed_ids
+    )
+    changes.errors.extend(
+        stored_specials[special_id] for special_id in error_ids
+    )
+
+    # The notifications list these in date order
+    changes.updated.sort(
+        key=lambda special_tuple: special_sort_key(special_tuple[1])
+    )
+    changes.removed.sort(key=special_sort_key)
+    return changes
+
+
+def special_sort_key(special):
+    return (
+        special.check_in if special.check_in else date(2000, 1, 1),
+        special.check_out if special.check_out else date(2000, 1, 1),
+    )
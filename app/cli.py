@@ -1,7 +1,9 @@
 import os
+import time
 import traceback
 from base64 import b64encode
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
 
 import click
 import sqlalchemy.exc
@@ -9,10 +11,34 @@ from flask import Blueprint, current_app, g, json, render_template
 from flask.cli import with_appcontext
 
 from . import db, notifications
-from .criteria import ImportantCriteria
+from .changes import (
+    ChangeSet,
+    diff_specials,
+    query_stored_specials,
+    special_sort_key,
+)
 from .errors import SpecialError
-from .models import APN, Email, ParserStatus, Phone, Status, StoredSpecial, User
+from .matches import (
+    add_matches,
+    get_criteria_index,
+    rebuild_matches,
+    remove_matches,
+)
+from .metrics import RunMetrics, get_run_stats, run_stage
+from .models import (
+    APN,
+    Email,
+    ParserStatus,
+    Phone,
+    ResponseValidator,
+    SpecialEvent,
+    Status,
+    StoredSpecial,
+    UpdateRun,
+    User,
+)
 from .parsers import PARSERS
+from .profiling import PROFILERS, Profiler, profile_thread
 from .util import test_old_values
 
 cli_bp = Blueprint("cli", __name__)
@@ -51,12 +77,33 @@ def make_new_user(username, password):
         print("New user created successfully!")
 
 
+@cli_bp.cli.command(
+    name="rebuild-matches",
+    help="Find the specials that are important to each user again, from scratch.",
+)
+@with_appcontext
+def rebuild_matches_cli():
+    users = db.session.scalars(db.select(User)).all()
+    rebuild_matches(users)
+    db.session.commit()
+    print(f"Rebuilt the matched specials of {len(users)} users.")
+
+
 @cli_bp.cli.command(
     help="Reset all specials' error attributes to false & overall health to true."
 )
 @with_appcontext
 def reset_errors():
-    db.session.execute(db.update(StoredSpecial).values(error=False))
+    # The fingerprints include 'error', clearing them means the next update
+    # compares every special field by field and makes new ones. The content
+    # fingerprints and response validators are cleared too so the next update
+    # doesn't skip any parser, either because its content is the same or
+    # because the site answers with a 304.
+    db.session.execute(
+        db.update(StoredSpecial).values(error=False, fingerprint=None)
+    )
+    db.session.execute(db.update(ParserStatus).values(content_fingerprint=None))
+    db.session.execute(db.delete(ResponseValidator))
     Status.default.healthy = True
     db.session.commit()
 
@@ -248,25 +295,117 @@ def test_error(send_error_report):
     is_flag=True,
     help="Produce an error report via email of all of the current errors.",
 )
+@click.option(
+    "--force",
+    is_flag=True,
+    help=(
+        "Retrieve and process the specials of every parser, even if they have "
+        "not changed since the last update."
+    ),
+)
+@click.option(
+    "--profile",
+    type=click.Choice(PROFILERS),
+    is_flag=False,
+    flag_value="cprofile",
+    default=None,
+    help=(
+        "Profile the update with cProfile (the default) or tracemalloc. When "
+        "used with '--local' every parser is always processed, as with "
+        "'--force', so the same file can be profiled again and again."
+    ),
+)
+@click.option(
+    "--profile-dir",
+    default="profiles",
+    show_default=True,
+    type=click.Path(file_okay=False),
+    help="Directory the profile is written to.",
+)
+@click.option(
+    "--profile-top",
+    default=20,
+    show_default=True,
+    help="Number of the top functions (or lines for tracemalloc) to print.",
+)
+@with_appcontext
+def update_specials_cli(
+    local_specials,
+    send_email,
+    send_error_report,
+    force,
+    profile,
+    profile_dir,
+    profile_top,
+):
+    if profile is None:
+        update_specials(local_specials, send_email, send_error_report, force)
+        return
+
+    force = force or bool(local_specials)
+    with Profiler(
+        profile, profile_dir, profile_top, name="update-specials"
+    ) as profiler:
+        g.profiler = profiler
+        update_specials(local_specials, send_email, send_error_report, force)
+
+
+@cli_bp.cli.command(
+    name="run-stats",
+    help="Print the p50 & p95 of the stage timings and counts of the last N update-specials runs.",
+)
+@click.option(
+    "-n",
+    "--last",
+    default=50,
+    show_default=True,
+    help="Number of runs to include.",
+)
 @with_appcontext
-def update_specials_cli(local_specials, send_email, send_error_report):
-    update_specials(local_specials, send_email, send_error_report)
+def run_stats(last):
+    runs = db.session.scalars(
+        db.select(UpdateRun).order_by(UpdateRun.started_at.desc()).limit(last)
+    ).all()
+    if not runs:
+        print("No update-specials runs have been recorded yet.")
+        return
+    runs.reverse()
+
+    print(
+        f"Last {len(runs)} runs, from {runs[0].started_at:%Y-%m-%d %H:%M} "
+        f"to {runs[-1].started_at:%Y-%m-%d %H:%M} (UTC)"
+    )
+    print(f"{'':<40}{'p50':>12}{'p95':>12}{'trend':>8}")
+    for name, is_duration, p50, p95, trend in get_run_stats(runs):
+        if is_duration:
+            p50_str, p95_str = f"{p50:.3f}s", f"{p95:.3f}s"
+        else:
+            p50_str, p95_str = f"{p50:,.0f}", f"{p95:,.0f}"
+        trend_str = f"{trend:+.0%}" if trend is not None else ""
+        print(f"{name:<40}{p50_str:>12}{p95_str:>12}{trend_str:>8}")
 
 
-def update_specials(local_specials, send_email, send_error_report):
+def update_specials(local_specials, send_email, send_error_report, force=False):
     g.send_error_report = send_error_report
+    g.run_id = uuid4().hex
+    g.run_metrics = RunMetrics(g.run_id)
+    g.run_metrics.start()
     try:
-        # Get the current specials from either the Internet or a local file
-        all_current_specials = get_current_specials(local_specials)
-        all_new_specials = {}
-        all_stored_specials = []
-        all_updated_specials_tuple = []
-        all_removed_specials_list = []
+        # Get the current specials from either the Internet or a local file.
+        # The error report needs every parser's specials, so it is always forced.
+        all_current_specials, parser_errors = get_current_specials(
+            local_specials, force or send_error_report
+        )
+        all_changes = ChangeSet()
 
         for parser_source in all_current_specials:
-            # Make a copy of all the specials, needed for when we check everything
-            # for errors later
-            new_specials = all_current_specials[parser_source].copy()
+            # Nothing has changed for this parser, so the stored specials are
+            # still current
+            if all_current_specials[parser_source] is None:
+                print(f"Using the stored specials for '{parser_source}'.")
+                continue
+
+            new_specials = all_current_specials[parser_source]
 
             if len(new_specials) == 0:
                 if not empty_parser_error(parser_source):
@@ -275,50 +414,86 @@ def update_specials(local_specials, send_email, send_error_report):
             # Since the parser has specials in it, set it to healthy
             parser_healthy(parser_source)
 
-            # Get the stored specials from the db
-            stored_specials = db.session.scalars(
-                db.select(StoredSpecial)
-                .filter_by(source=parser_source)
-                .order_by(StoredSpecial.check_in, StoredSpecial.check_out)
-            ).all()
-
-            # Check for any changes to the specials
-            updated_specials_tuple, removed_specials_list = check_for_changes(
-                new_specials, stored_specials
+            # Check for any changes to the specials, the stored specials are
+            # read from the db as they are compared
+            all_changes.extend(
+                diff_specials(
+                    new_specials, query_stored_specials(parser_source)
+                )
             )
 
-            all_new_specials.update(new_specials)
-            all_stored_specials.extend(stored_specials)
-            all_updated_specials_tuple.extend(updated_specials_tuple)
-            all_removed_specials_list.extend(removed_specials_list)
+        # Specials that need to be checked for errors later
+        error_specials = all_changes.errors
 
-        # Adding new Specials
-        new_specials_list = store_new_specials(
-            all_new_specials, all_stored_specials
-        )
+        with run_stage("persist"):
+            # Adding new Specials
+            new_specials_list = store_new_specials(
+                all_changes.added, error_specials
+            )
 
-        # Updating Old Specials
-        updated_specials_list = update_old_specials(all_updated_specials_tuple)
+            # Updating Old Specials
+            updated_specials_list = update_old_specials(all_changes.updated)
+            error_specials.extend(updated_specials_list)
+
+            # Deleting Removed Specials, the users they were important to are
+            # read from their matches as the matches are deleted
+            important_removed_specials = remove_matches(all_changes.removed)
+            removed_specials_list = remove_old_specials(all_changes.removed)
+
+            # Keep a history of all the changes
+            SpecialEvent.record(
+                new_specials_list,
+                updated_specials_list,
+                removed_specials_list,
+                g.run_id,
+            )
 
-        # Deleting Removed Specials
-        removed_specials_list = remove_old_specials(all_removed_specials_list)
+        g.run_metrics.counts.update(
+            new=len(new_specials_list),
+            updated=len(updated_specials_list),
+            removed=len(removed_specials_list),
+            errors=sum(1 for special in error_specials if special.error),
+        )
 
         # Record that we have just updated the specials.
         Status.default.update()
 
-        for user in db.session.scalars(db.select(User)):
-            important_criteria = ImportantCriteria(user.important_criteria)
-            # Send an email if we need to.... i.e. if there were any kind of updates
-            send_new_specials = get_send_specials_list(
-                new_specials_list, important_criteria
+        users = db.session.scalars(db.select(User)).all()
+        with run_stage("matching"):
+            # Every user's criteria are indexed together, so each special is
+            # only matched once rather than once for every user. The matches
+            # are stored, so they are only found again when a special changes.
+            criteria_index = get_criteria_index(users)
+            important_new_specials = add_matches(
+                criteria_index, new_specials_list
             )
-            send_updated_specials = get_send_specials_list(
-                updated_specials_list, important_criteria
-            )
-            send_removed_specials = get_send_specials_list(
-                removed_specials_list, important_criteria
+            remove_matches(updated_specials_list)
+            important_updated_specials = add_matches(
+                criteria_index, updated_specials_list
             )
 
+        for user in users:
+            with run_stage("matching"):
+                important_only = criteria_index.criteria[
+                    user.user_id
+                ].important_only
+                # Send an email if we need to.... i.e. if there were any kind of updates
+                send_new_specials = get_send_specials_list(
+                    new_specials_list,
+                    important_only,
+                    important_new_specials.get(user.user_id, []),
+                )
+                send_updated_specials = get_send_specials_list(
+                    updated_specials_list,
+                    important_only,
+                    important_updated_specials.get(user.user_id, []),
+                )
+                send_removed_specials = get_send_specials_list(
+                    removed_specials_list,
+                    important_only,
+                    important_removed_specials.get(user.user_id, []),
+                )
+
             changes = []
             if len(send_new_specials) > 0:
                 changes.append(("Added", send_new_specials))
@@ -327,23 +502,27 @@ def update_specials(local_specials, send_email, send_error_report):
             if len(send_removed_specials) > 0:
                 changes.append(("Removed", send_removed_specials))
             if changes and send_email:
-                email_message = render_template(
-                    "specials/email_template.html",
-                    specials_group=changes,
-                    env_label=current_app.config.get("ENV_LABEL"),
-                )
-                notification_response = notifications.send_update_email(
-                    email_message, user
-                )
+                with run_stage("render"):
+                    email_message = render_template(
+                        "specials/email_template.html",
+                        specials_group=changes,
+                        env_label=current_app.config.get("ENV_LABEL"),
+                    )
+                with run_stage("notify.email"):
+                    notification_response = notifications.send_update_email(
+                        email_message, user
+                    )
 
                 # Send a text/push notification if any of the changes were considered important
                 if contains_important(send_new_specials) or contains_important(
                     send_updated_specials
                 ):
-                    notifications.send_update_text_message(user)
-                    notifications.send_update_push_notification(
-                        user, message_id=notification_response.data
-                    )
+                    with run_stage("notify.text"):
+                        notifications.send_update_text_message(user)
+                    with run_stage("notify.push"):
+                        notifications.send_update_push_notification(
+                            user, message_id=notification_response.data
+                        )
 
         changes_made = (
             len(new_specials_list)
@@ -358,35 +537,138 @@ def update_specials(local_specials, send_email, send_error_report):
             print("No changes found. Nothing to update Cap'n. :-)")
 
         # Handle any errors that were generated during the parsing of the specials
-        handle_errors(all_current_specials, all_stored_specials)
-        Status.default.healthy = True
+        with run_stage("errors"):
+            handle_errors(all_current_specials, error_specials)
+
+        # A parser that failed is left out of this run, all of its stored
+        # specials are left untouched until it succeeds again
+        if parser_errors:
+            handle_parser_errors(parser_errors)
+        else:
+            Status.default.healthy = True
     except Exception as e:
         unhandled_error(e)
 
-    db.session.commit()
+    with run_stage("commit"):
+        db.session.commit()
 
+    g.run_metrics.stop()
+    g.run_metrics.save()
+
+
+def get_current_specials(local_specials, force=False):
+    # Every parser is fetched and parsed in its own thread, so the time this
+    # takes is that of the slowest parser rather than the sum of all of them.
+    app = current_app._get_current_object()
+    dvc_parsers = [Parser() for Parser in PARSERS]
+    if not force:
+        for dvc_parser in dvc_parsers:
+            dvc_parser.response_validators = get_response_validators(
+                dvc_parser.source
+            )
+            dvc_parser.previous_fingerprint = get_parser_status(
+                dvc_parser.source
+            ).content_fingerprint
+    with ThreadPoolExecutor(
+        max_workers=max(1, current_app.config["PARSER_WORKERS"])
+    ) as executor:
+        futures = [
+            executor.submit(
+                get_parser_specials,
+                app,
+                dvc_parser,
+                local_special_for_parser(dvc_parser, local_specials),
+                g.get("profiler"),
+            )
+            for dvc_parser in dvc_parsers
+        ]
 
-def get_current_specials(local_specials):
+    # Collect the results in the same order as PARSERS, an exception from one
+    # parser doesn't stop us from using the specials of the others
     all_new_specials = {}
-    for Parser in PARSERS:
-        dvc_parser = Parser()
-        local_special = local_special_for_parser(dvc_parser, local_specials)
-        dvc_parser_specials = dvc_parser.get_all_specials(local_special)
-        all_new_specials[dvc_parser.source] = dvc_parser_specials
-    return all_new_specials
+    parser_errors = {}
+    for dvc_parser, future in zip(dvc_parsers, futures):
+        try:
+            all_new_specials[dvc_parser.source] = future.result()
+        except Exception as e:
+            parser_errors[dvc_parser.source] = e
+        else:
+            store_response_validators(dvc_parser)
+            store_content_fingerprint(dvc_parser)
+        record_parser_metrics(dvc_parser)
+    return all_new_specials, parser_errors
+
+
+def get_parser_specials(app, dvc_parser, local_special, profiler=None):
+    # The parsers use the config and json provider of the app, so each thread
+    # needs its own app context
+    with app.app_context(), profile_thread(profiler):
+        start = time.perf_counter()
+        try:
+            return dvc_parser.get_all_specials(local_special)
+        finally:
+            dvc_parser.total_seconds = time.perf_counter() - start
+
+
+def record_parser_metrics(dvc_parser):
+    # The specials are parsed while they are downloaded, whatever time wasn't
+    # spent waiting on the site was spent parsing
+    metrics = g.get("run_metrics")
+    if metrics is None:
+        return
+    total_seconds = getattr(dvc_parser, "total_seconds", 0)
+    metrics.add_duration(f"fetch.{dvc_parser.source}", dvc_parser.fetch_seconds)
+    metrics.add_duration(
+        f"parse.{dvc_parser.source}",
+        max(0, total_seconds - dvc_parser.fetch_seconds),
+    )
+    metrics.bytes_downloaded += dvc_parser.bytes_downloaded
 
 
-def get_send_specials_list(specials, important_criteria):
-    is_important_special = important_criteria  # Doing this just so the name makes more sense given that it is called
-    if important_criteria.important_only:
-        return [
-            (special, True)
-            for special in specials
-            if is_important_special(special)
-        ]
+def get_response_validators(parser_source):
+    return {
+        validator.request_key: (validator.etag, validator.last_modified)
+        for validator in db.session.scalars(
+            db.select(ResponseValidator).filter_by(parser_source=parser_source)
+        )
+    }
+
+
+def store_response_validators(dvc_parser):
+    if dvc_parser.response_validators is None:
+        return
+    for request_key, validators in dvc_parser.response_validators.items():
+        etag, last_modified = validators
+        db.session.merge(
+            ResponseValidator(
+                request_key=request_key,
+                parser_source=dvc_parser.source,
+                etag=etag,
+                last_modified=last_modified,
+            )
+        )
+
+
+def store_content_fingerprint(dvc_parser):
+    if dvc_parser.content_fingerprint is None:
+        return
+    parser_status = get_parser_status(dvc_parser.source)
+    parser_status.content_fingerprint = dvc_parser.content_fingerprint
+
+
+def get_send_specials_list(specials, important_only, important_specials):
+    """
+    Pairs each special with whether it is important. 'important_specials' are
+    the ones in 'specials' that are important to the user, in the same order
+    (see 'add_matches').
+    """
+    if important_only:
+        return [(special, True) for special in important_specials]
     else:
+        important_ids = {special.special_id for special in important_specials}
         return [
-            (special, is_important_special(special)) for special in specials
+            (special, special.special_id in important_ids)
+            for special in specials
         ]
 
 
@@ -398,20 +680,15 @@ def contains_important(send_tuple):
 
 
 def store_new_specials(new_specials, stored_specials):
-    new_specials_list = []
-    for new_special_key in new_specials:
-        special_entry = add_special(new_specials[new_special_key])
-        stored_specials.append(special_entry)
-        new_specials_list.append(special_entry)
+    new_specials_list = [
+        StoredSpecial.from_parsed_special(parsed_special)
+        for parsed_special in new_specials.values()
+    ]
+    StoredSpecial.bulk_insert(new_specials_list)
+    stored_specials.extend(new_specials_list)
 
     if len(new_specials_list) > 1:
-        new_specials_list = sorted(
-            new_specials_list,
-            key=lambda special: (
-                special.check_in if special.check_in else date(2000, 1, 1),
-                special.check_out if special.check_out else date(2000, 1, 1),
-            ),
-        )
+        new_specials_list = sorted(new_specials_list, key=special_sort_key)
 
     return new_specials_list
 
@@ -422,62 +699,30 @@ def update_old_specials(updated_specials_tuple):
         parsed_special, stored_special = special_tuple
         stored_special.update_with_special(parsed_special)
         updated_specials_list.append(stored_special)
+    StoredSpecial.bulk_update(updated_specials_list)
 
     return updated_specials_list
 
 
 def remove_old_specials(removed_specials):
-    removed_specials_list = []
-    for stored_special in removed_specials:
-        remove_special(stored_special)
-        removed_specials_list.append(stored_special)
+    removed_specials_list = list(removed_specials)
+    StoredSpecial.bulk_delete(removed_specials_list)
 
     return removed_specials_list
 
 
-def check_for_changes(new_specials, stored_specials):
-    updated_specials_tuple = []
-    removed_specials_list = []
-    for stored_special in stored_specials:
-        if stored_special.special_id in new_specials:
-            new_special = new_specials[stored_special.special_id]
-            if stored_special != new_special:
-                updated_specials_tuple.append((new_special, stored_special))
-            del new_specials[stored_special.special_id]
-        else:
-            removed_specials_list.append(stored_special)
-
-    return updated_specials_tuple, removed_specials_list
-
-
-def add_special(parsed_special):
-    special_entry = StoredSpecial.from_parsed_special(parsed_special)
-    db.session.add(special_entry)
-    return special_entry
-
-
-def remove_special(stored_special):
-    db.session.delete(stored_special)
-
-
 def handle_errors(new_specials, stored_specials):
     new_specials_flat = {}
     for key in new_specials:
-        new_specials_flat.update(new_specials[key])
+        if new_specials[key] is not None:
+            new_specials_flat.update(new_specials[key])
     new_specials_errors = [
         new_specials_flat[stored_special.special_id]
         for stored_special in stored_specials
         if stored_special.new_error
     ]
 
-    email_addresses: list[Email] = db.session.scalars(  # pyright: ignore[reportAssignmentType]
-        db.select(Email).filter_by(get_errors=True)
-    ).all()
-    email_addresses_grouped: dict[int, list[Email]] = {}
-    for email in email_addresses:
-        user: list[Email] = email_addresses_grouped.get(email.user_id, [])
-        user.append(email.email_address)
-        email_addresses_grouped[email.user_id] = user
+    email_addresses_grouped = get_error_email_addresses()
 
     if len(new_specials_errors) > 0:
         error_msg = render_template(
@@ -489,12 +734,9 @@ def handle_errors(new_specials, stored_specials):
             "Uhh-ohh, Houston, we have a problem. There appears to be an error."
         )
 
-        notification_response = None
-        for emails_addresses in email_addresses_grouped.values():
-            # TODO: Don't only use the last response
-            notification_response = notifications.send_error_email(
-                error_msg, emails_addresses
-            )
+        notification_response = send_error_emails(
+            notifications.send_error_email, error_msg, email_addresses_grouped
+        )
         notifications.send_error_text_messsage()
         notifications.send_error_push_notification(
             message_id=notification_response.data
@@ -526,6 +768,35 @@ def handle_errors(new_specials, stored_specials):
                 )
 
 
+def send_error_emails(
+    send_error_func, error_msg, email_addresses_grouped, **kwargs
+):
+    """
+    Sends 'error_msg' with 'send_error_func' to the error email addresses of
+    each user (see 'get_error_email_addresses'). Returns the response of the
+    last one, or None when nobody gets error emails.
+    """
+    notification_response = None
+    for email_addresses in email_addresses_grouped.values():
+        # TODO: Don't only use the last response
+        notification_response = send_error_func(
+            error_msg, email_addresses, **kwargs
+        )
+    return notification_response
+
+
+def get_error_email_addresses():
+    email_addresses: list[Email] = db.session.scalars(  # pyright: ignore[reportAssignmentType]
+        db.select(Email).filter_by(get_errors=True)
+    ).all()
+    email_addresses_grouped: dict[int, list[Email]] = {}
+    for email in email_addresses:
+        user: list[Email] = email_addresses_grouped.get(email.user_id, [])
+        user.append(email.email_address)
+        email_addresses_grouped[email.user_id] = user
+    return email_addresses_grouped
+
+
 def empty_parser_error(parser_source):
     parser_status = get_parser_status(parser_source)
     if parser_status.healthy and not parser_status.empty_okay:
@@ -561,25 +832,49 @@ def get_parser_status(parser_source):
     return parser_status
 
 
+def handle_parser_errors(parser_errors):
+    error_msgs = []
+    for parser_source, error in parser_errors.items():
+        print(f"Unable to retrieve specials from '{parser_source}':")
+        traceback.print_exception(error)
+        error_msgs.append(f"Parser: {parser_source}\n\n{error_message(error)}")
+    send_unhandled_error("\n\n".join(error_msgs))
+
+
 def unhandled_error(error):
     traceback.print_exc()
     db.session.rollback()
+    send_unhandled_error(error_message(error))
+
+
+def send_unhandled_error(error_msg):
     if Status.default.healthy or g.send_error_report:
-        error_msg = f"Unhandled Exception: {error_type(error)}\n\n{error}\n\n{traceback.format_exc()}"
         send_error_func = (
             notifications.send_error_report_email
             if g.send_error_report
             else notifications.send_error_email
         )
-        notification_response = send_error_func(error_msg, html_message=False)
+        notification_response = send_error_emails(
+            send_error_func,
+            error_msg,
+            get_error_email_addresses(),
+            html_message=False,
+        )
         if Status.default.healthy:
             notifications.send_error_text_messsage()
             notifications.send_error_push_notification(
-                message_id=notification_response.data
+                message_id=notification_response and notification_response.data
             )
         Status.default.healthy = False
 
 
+def error_message(error):
+    return (
+        f"Unhandled Exception: {error_type(error)}\n\n{error}\n\n"
+        f"{''.join(traceback.format_exception(error))}"
+    )
+
+
 # From traceback.py in CPython Line #563
 def error_type(error):
     err_type = type(error).__qualname__
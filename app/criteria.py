@@ -1,15 +1,26 @@
+import hashlib
+import json
 import os
 import types
-from collections import namedtuple
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
 from datetime import date
 from functools import cached_property
+from operator import attrgetter
 
 from werkzeug.datastructures import MultiDict
 
+from . import db
+from .models import StoredSpecial
 from .util import SpecialTypes
 
 Range = namedtuple("Range", ["start", "end"])
 
+# The compiled criteria by the hash of their JSON (see 'criteria_hash'), many
+# users have the same criteria and they don't change between runs.
+COMPILED_CRITERIA_CACHE_SIZE = 1024
+compiled_criteria_cache = {}
+
 
 class DecoratorDict(dict):
     def mapped_func(self, key, valid_types=None):
@@ -62,7 +73,78 @@ class ImportantCriteria:
     def valid_criteria_for_type(cls, special_type):
         return cls.criteria_map["_valid_types"].getlist(special_type)
 
+    """
+    The criteria compiled into a tuple of predicates for each special type,
+    one for every criteria block. Blocks that can never match a special are
+    left out.
+    """
+
+    @cached_property
+    def compiled_criteria(self):
+        if not self.criteria:
+            return {}
+        key = criteria_hash(self.criteria)
+        compiled = compiled_criteria_cache.get(key)
+        if compiled is None:
+            compiled = self.compile_criteria(self.criteria)
+            if len(compiled_criteria_cache) >= COMPILED_CRITERIA_CACHE_SIZE:
+                compiled_criteria_cache.clear()
+            compiled_criteria_cache[key] = compiled
+        return compiled
+
+    @classmethod
+    def compile_criteria(cls, criteria):
+        compiled = {}
+        for special_type in SpecialTypes:
+            blocks = tuple(
+                block
+                for block in (
+                    cls.compile_block(special_type, block_criteria)
+                    for block_criteria in criteria.get(special_type, [])
+                )
+                if block is not None
+            )
+            if blocks:
+                compiled[special_type] = blocks
+        return compiled
+
+    @classmethod
+    def compile_block(cls, special_type, block_criteria):
+        """
+        Compiles one block of criteria into a single predicate, which is None
+        when the block can never match.
+        """
+        checks = []
+        for criterion, value in block_criteria.items():
+            check = criteria_compilers[criterion](special_type, value)
+            if check is None:
+                return None
+            checks.append(check)
+        if not checks:
+            return None
+        if len(checks) == 1:
+            return checks[0]
+        checks = tuple(checks)
+
+        def is_important_block(special):
+            for check in checks:
+                if not check(special):
+                    return False
+            return True
+
+        return is_important_block
+
     def is_important_special(self, special):
+        for is_important_block in self.compiled_criteria.get(special.type, ()):
+            if is_important_block(special):
+                return True
+        return False
+
+    def check_special(self, special):
+        """
+        The same as 'is_important_special', except it goes through the
+        criteria with the 'criteria_map' functions each time.
+        """
         if not self.criteria:
             return False
 
@@ -78,6 +160,70 @@ class ImportantCriteria:
                 return True
         return False
 
+    def where_clause(self):
+        """
+        The criteria as a SQL expression for StoredSpecial, so only the
+        important specials need to be loaded from the database. The blocks are
+        or-ed together and the criteria in each block are and-ed, like
+        'is_important_special'.
+        """
+        clauses = []
+        for special_type in SpecialTypes:
+            for block_criteria in self.criteria.get(special_type, []):
+                clause = self.block_clause(special_type, block_criteria)
+                if clause is not None:
+                    clauses.append(clause)
+        if not clauses:
+            return db.false()
+        return db.or_(*clauses)
+
+    @classmethod
+    def block_clause(cls, special_type, block_criteria):
+        """
+        One block of criteria as a SQL expression, which is None when the
+        block can never match.
+        """
+        clauses = []
+        for criterion, value in block_criteria.items():
+            clause = criteria_clauses[criterion](special_type, value)
+            if clause is None:
+                return None
+            clauses.append(clause)
+        if not clauses:
+            return None
+        return db.and_(StoredSpecial.type == special_type, *clauses)
+
+    def important_mask(self, columns):
+        """
+        Checks the criteria against all of the specials in 'columns' (a
+        SpecialColumns) at once. Returns a bitmap of the specials that are
+        important, see 'SpecialColumns'.
+        """
+        if not self.criteria:
+            return 0
+
+        mask = 0
+        for special_type in SpecialTypes:
+            type_mask = columns.value_mask("type", special_type)
+            if not type_mask:
+                continue
+            for block_criteria in self.criteria.get(special_type, []):
+                if not block_criteria:
+                    continue
+                block_mask = type_mask
+                for criterion, value in block_criteria.items():
+                    criterion_mask = criteria_maskers[criterion](
+                        columns, special_type, value
+                    )
+                    if criterion_mask is None:
+                        block_mask = 0
+                    else:
+                        block_mask &= criterion_mask
+                    if not block_mask:
+                        break
+                mask |= block_mask
+        return mask
+
     @criteria_map.mapped_func("date")
     def is_important_date(self, special, imp_date):
         check_out = special.check_out
@@ -123,7 +269,7 @@ class ImportantCriteria:
             if special.price_per_point is None:
                 return False
             return special.price_per_point <= value
-        return is_important_price(special, value)
+        return self.is_important_price(special, value)
 
     @criteria_map.mapped_func("points", SpecialTypes.DISC_POINTS)
     def is_important_points(self, special, value):
@@ -148,3 +294,783 @@ class ImportantCriteria:
         if special.view is None:
             return False
         return special.view_id in views
+
+
+class CriteriaIndex:
+    """
+    An index of the criteria of many users ('criteria_by_key' is a dictionary
+    of ImportantCriteria by something that identifies the user, i.e. their
+    user_id). 'match' finds the users a special is important to without going
+    through each of their criteria, so matching a special costs about the same
+    no matter how many users there are.
+
+    Each criteria block gets a bit. For every criterion there is a mask of the
+    blocks the special meets it for (see 'MembershipIndex' and
+    'ThresholdIndex'), these are and-ed together to get the blocks the special
+    meets every criterion of.
+    """
+
+    def __init__(self, criteria_by_key):
+        self.criteria = criteria_by_key
+        blocks = defaultdict(list)
+        for key, important_criteria in criteria_by_key.items():
+            criteria = important_criteria.criteria or {}
+            for special_type in SpecialTypes:
+                for block, block_criteria in enumerate(
+                    criteria.get(special_type, [])
+                ):
+                    # Only the blocks that can ever match are indexed
+                    if (
+                        ImportantCriteria.compile_block(
+                            special_type, block_criteria
+                        )
+                        is not None
+                    ):
+                        blocks[special_type].append(
+                            (key, block, block_criteria)
+                        )
+        self.indexes = {
+            special_type: BlockIndex(special_type, type_blocks)
+            for special_type, type_blocks in blocks.items()
+        }
+
+    def match(self, special):
+        """
+        Returns the set of keys of the users 'special' is important to.
+        """
+        return set(self.match_blocks(special))
+
+    def match_blocks(self, special):
+        """
+        Returns the users 'special' is important to, as a dictionary of the
+        index of the first of their criteria blocks (for the special's type)
+        it matched by the users' keys.
+        """
+        block_index = self.indexes.get(special.type)
+        if block_index is None:
+            return {}
+        return block_index.match(special)
+
+    def match_all(self, specials):
+        """
+        Returns the specials that are important to each user, in the same
+        order as 'specials', in a dictionary by the users' keys.
+        """
+        matches = defaultdict(list)
+        for special in specials:
+            for key in self.match_blocks(special):
+                matches[key].append(special)
+        return matches
+
+
+class BlockIndex:
+    """
+    The criteria blocks of one special type, see 'CriteriaIndex'.
+    """
+
+    def __init__(self, special_type, blocks):
+        self.blocks = [(key, block) for key, block, _ in blocks]
+        self.all_blocks = (1 << len(blocks)) - 1
+        self.indexes = []
+        criteria_keys = {key for _, _, criteria in blocks for key in criteria}
+        for criterion in sorted(criteria_keys):
+            values = [criteria.get(criterion) for _, _, criteria in blocks]
+            self.indexes.extend(
+                criteria_indexers[criterion](special_type, values)
+            )
+
+    def match(self, special):
+        matched = self.all_blocks
+        for index in self.indexes:
+            matched &= index.mask(special)
+            if not matched:
+                return {}
+        # A user's blocks are in order, so the first one matched for each
+        # user comes from the lowest bit
+        keys = {}
+        while matched:
+            bit = matched & -matched
+            key, block = self.blocks[bit.bit_length() - 1]
+            keys.setdefault(key, block)
+            matched ^= bit
+        return keys
+
+
+class MembershipIndex:
+    """
+    The blocks that are met when the special's 'attribute' is one of the
+    block's values, or that don't have any values for it (None).
+    """
+
+    def __init__(self, attribute, values):
+        self.attribute = attribute
+        self.without = 0
+        masks = defaultdict(int)
+        for bit, block_values in enumerate(values):
+            if block_values is None:
+                self.without |= 1 << bit
+                continue
+            for value in set(block_values) - {None}:
+                masks[value] |= 1 << bit
+        self.masks = {
+            value: mask | self.without for value, mask in masks.items()
+        }
+
+    def mask(self, special):
+        return self.masks.get(getattr(special, self.attribute), self.without)
+
+
+class ThresholdIndex:
+    """
+    The blocks whose threshold is met by the value 'get_value' returns for the
+    special, or that don't have a threshold (None). When 'at_most' is True the
+    special's value has to be at most the threshold, otherwise at least it. A
+    special without a value (None) only meets the blocks without a threshold.
+    """
+
+    def __init__(self, get_value, thresholds, at_most):
+        self.get_value = get_value
+        self.at_most = at_most
+        self.without = 0
+        by_threshold = defaultdict(int)
+        for bit, threshold in enumerate(thresholds):
+            if threshold is None:
+                self.without |= 1 << bit
+            else:
+                by_threshold[threshold] |= 1 << bit
+        self.thresholds = sorted(by_threshold)
+
+        # The mask for each threshold includes every block that the threshold
+        # would be met for as well
+        ordered = reversed(self.thresholds) if at_most else self.thresholds
+        self.masks = []
+        mask = self.without
+        for threshold in ordered:
+            mask |= by_threshold[threshold]
+            self.masks.append(mask)
+        if at_most:
+            self.masks.reverse()
+
+    def mask(self, special):
+        value = self.get_value(special)
+        if value is None:
+            return self.without
+        if self.at_most:
+            i = bisect_left(self.thresholds, value)
+            return self.masks[i] if i < len(self.masks) else self.without
+        i = bisect_right(self.thresholds, value) - 1
+        return self.masks[i] if i >= 0 else self.without
+
+
+class SpecialColumns:
+    """
+    A batch of specials stored by column, for checking criteria against all of
+    them at once (see 'ImportantCriteria.important_mask'). The results are
+    bitmaps, ints with bit i set when specials[i] is included.
+
+    Each column is only read from the specials the first time it is needed.
+    The masks for a value or threshold are cached, so checking the criteria of
+    many users against the same batch only pays for each distinct value once.
+    """
+
+    column_getters = {
+        "type": attrgetter("type"),
+        "check_in": attrgetter("check_in"),
+        "check_out": attrgetter("check_out"),
+        "price": attrgetter("price"),
+        "points": attrgetter("points"),
+        "resort_id": attrgetter("resort_id"),
+        "room_id": attrgetter("room_id"),
+        "view_id": attrgetter("view_id"),
+    }
+
+    def __init__(self, specials):
+        self.specials = list(specials)
+        self.count = len(self.specials)
+        self._columns = {}
+        self._value_masks = {}
+        self._sorted_columns = {}
+        self._threshold_masks = {}
+
+    def important_masks(self, criteria_by_key):
+        """
+        Returns the bitmap of the specials that are important to each user,
+        from a dictionary of ImportantCriteria by something that identifies
+        the user (like 'CriteriaIndex').
+        """
+        return {
+            key: important_criteria.important_mask(self)
+            for key, important_criteria in criteria_by_key.items()
+        }
+
+    def column(self, name):
+        values = self._columns.get(name)
+        if values is None:
+            get_value = self.column_getters.get(name)
+            if get_value is None:
+                values = derived_columns[name](self)
+            else:
+                values = [get_value(special) for special in self.specials]
+            self._columns[name] = values
+        return values
+
+    def to_mask(self, indexes):
+        bits = bytearray(b"0" * self.count)
+        for i in indexes:
+            bits[i] = 49  # "1"
+        bits.reverse()
+        return int(bits, 2) if bits else 0
+
+    def flags(self, mask):
+        """
+        Returns whether each special's bit is set in 'mask', in order.
+        """
+        if not self.count:
+            return []
+        bits = format(mask, f"0{self.count}b")[::-1]
+        return [bit == "1" for bit in bits]
+
+    def value_mask(self, name, value):
+        """
+        The specials whose 'name' column is 'value'.
+        """
+        masks = self._value_masks.get(name)
+        if masks is None:
+            indexes = defaultdict(list)
+            for i, column_value in enumerate(self.column(name)):
+                indexes[column_value].append(i)
+            masks = {
+                column_value: self.to_mask(value_indexes)
+                for column_value, value_indexes in indexes.items()
+            }
+            self._value_masks[name] = masks
+        return masks.get(value, 0)
+
+    def values_mask(self, name, values):
+        """
+        The specials whose 'name' column is one of 'values' (None is never
+        included).
+        """
+        mask = 0
+        for value in set(values) - {None}:
+            mask |= self.value_mask(name, value)
+        return mask
+
+    def threshold_mask(self, name, threshold, at_most):
+        """
+        The specials whose 'name' column is at most 'threshold' when 'at_most'
+        is True, otherwise at least it. Specials without a value (None) are
+        never included.
+        """
+        key = (name, threshold, at_most)
+        mask = self._threshold_masks.get(key)
+        if mask is None:
+            values, indexes = self.sorted_column(name)
+            if at_most:
+                mask = self.to_mask(indexes[: bisect_right(values, threshold)])
+            else:
+                mask = self.to_mask(indexes[bisect_left(values, threshold) :])
+            self._threshold_masks[key] = mask
+        return mask
+
+    def sorted_column(self, name):
+        # The column's values (without None) in order, along with the index
+        # of the special each of them is from
+        sorted_column = self._sorted_columns.get(name)
+        if sorted_column is None:
+            pairs = sorted(
+                (value, i)
+                for i, value in enumerate(self.column(name))
+                if value is not None
+            )
+            sorted_column = (
+                [value for value, _ in pairs],
+                [i for _, i in pairs],
+            )
+            self._sorted_columns[name] = sorted_column
+        return sorted_column
+
+
+# Each of the 'criteria_map' functions, as a function that takes the special
+# type and the criterion's value and returns a predicate with the value already
+# bound. These must give the same result as the 'criteria_map' function. When
+# the criterion can never be met for the special type they return None instead.
+
+criteria_compilers = {}
+
+
+def compiles(key):
+    def decorated_function(func):
+        criteria_compilers[key] = func
+        return func
+
+    return decorated_function
+
+
+@compiles("date")
+def compile_date(special_type, imp_date):
+    if "end" not in imp_date:
+        return None
+    end = imp_date["end"]
+    if special_type == SpecialTypes.PRECONFIRM:
+        if "start" not in imp_date:
+            return None
+        start = imp_date["start"]
+        if start > end:
+            return None
+
+        # The same as the ranges overlapping by at least one day
+        def is_important_date(special):
+            check_in = special.check_in
+            check_out = special.check_out
+            return (
+                check_in is not None
+                and check_out is not None
+                and check_in <= end
+                and start <= check_out
+                and check_in <= check_out
+            )
+
+    else:
+
+        def is_important_date(special):
+            check_out = special.check_out
+            return check_out is not None and check_out >= end
+
+    return is_important_date
+
+
+@compiles("length_of_stay")
+def compile_length_of_stay(special_type, value):
+    def is_important_length_of_stay(special):
+        check_in = special.check_in
+        check_out = special.check_out
+        return (
+            check_in is not None
+            and check_out is not None
+            and (check_out - check_in).days >= value
+        )
+
+    return is_important_length_of_stay
+
+
+@compiles("price")
+def compile_price(special_type, value):
+    def is_important_price(special):
+        price = special.price
+        return price is not None and price <= value
+
+    return is_important_price
+
+
+@compiles("price_per_night")
+def compile_price_per_night(special_type, value):
+    def is_important_price_per_night(special):
+        price = special.price
+        check_in = special.check_in
+        check_out = special.check_out
+        if price is None or check_in is None or check_out is None:
+            return False
+        duration = (check_out - check_in).days
+        return duration != 0 and price / duration <= value
+
+    return is_important_price_per_night
+
+
+@compiles("price_per_point")
+def compile_price_per_point(special_type, value):
+    if special_type != SpecialTypes.PRECONFIRM:
+        return compile_price(special_type, value)
+
+    def is_important_price_per_point(special):
+        price = special.price
+        points = special.points
+        return bool(price is not None and points and price / points <= value)
+
+    return is_important_price_per_point
+
+
+@compiles("points")
+def compile_points(special_type, value):
+    def is_important_points(special):
+        points = special.points
+        return points is not None and points >= value
+
+    return is_important_points
+
+
+@compiles("resorts")
+def compile_resorts(special_type, resorts):
+    resorts = frozenset(resorts) - {None}
+
+    def is_important_resort(special):
+        return special.resort_id in resorts
+
+    return is_important_resort
+
+
+@compiles("rooms")
+def compile_rooms(special_type, rooms):
+    rooms = frozenset(rooms) - {None}
+
+    def is_important_room(special):
+        return special.room_id in rooms
+
+    return is_important_room
+
+
+@compiles("views")
+def compile_views(special_type, views):
+    views = frozenset(views) - {None}
+
+    def is_important_view(special):
+        return special.view_id in views
+
+    return is_important_view
+
+
+def criteria_hash(criteria):
+    """
+    A hash of the JSON of 'criteria', which is the same for equal criteria.
+    """
+    criteria_json = json.dumps(
+        {getattr(key, "value", key): value for key, value in criteria.items()},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(criteria_json.encode()).hexdigest()
+
+
+# Each of the 'criteria_map' functions as the indexes of a 'BlockIndex', from
+# the special type and the criterion's value for every block (None for the
+# blocks without the criterion). Like the compiled criteria these must give the
+# same results as the 'criteria_map' functions.
+criteria_indexers = {}
+
+
+def indexes(key):
+    def decorated_function(func):
+        criteria_indexers[key] = func
+        return func
+
+    return decorated_function
+
+
+def get_stay_check_in(special):
+    # Only a stay that ends on or after the day it starts overlaps anything
+    check_in = special.check_in
+    check_out = special.check_out
+    if check_in is None or check_out is None or check_in > check_out:
+        return None
+    return check_in
+
+
+def get_stay_check_out(special):
+    if get_stay_check_in(special) is None:
+        return None
+    return special.check_out
+
+
+def get_duration(special):
+    check_in = special.check_in
+    check_out = special.check_out
+    if check_in is None or check_out is None:
+        return None
+    return (check_out - check_in).days
+
+
+def get_price_per_night(special):
+    price = special.price
+    duration = get_duration(special)
+    if price is None or not duration:
+        return None
+    return price / duration
+
+
+def get_price_per_point(special):
+    price = special.price
+    points = special.points
+    if price is None or not points:
+        return None
+    return price / points
+
+
+@indexes("date")
+def index_date(special_type, values):
+    ends = [
+        imp_date.get("end") if imp_date is not None else None
+        for imp_date in values
+    ]
+    if special_type != SpecialTypes.PRECONFIRM:
+        return [ThresholdIndex(attrgetter("check_out"), ends, at_most=False)]
+
+    # The ranges overlap when the special starts by the end of the block's
+    # range and ends on or after the start of it
+    starts = [
+        imp_date.get("start") if imp_date is not None else None
+        for imp_date in values
+    ]
+    return [
+        ThresholdIndex(get_stay_check_in, ends, at_most=True),
+        ThresholdIndex(get_stay_check_out, starts, at_most=False),
+    ]
+
+
+@indexes("length_of_stay")
+def index_length_of_stay(special_type, values):
+    return [ThresholdIndex(get_duration, values, at_most=False)]
+
+
+@indexes("price")
+def index_price(special_type, values):
+    return [ThresholdIndex(attrgetter("price"), values, at_most=True)]
+
+
+@indexes("price_per_night")
+def index_price_per_night(special_type, values):
+    return [ThresholdIndex(get_price_per_night, values, at_most=True)]
+
+
+@indexes("price_per_point")
+def index_price_per_point(special_type, values):
+    if special_type != SpecialTypes.PRECONFIRM:
+        return index_price(special_type, values)
+    return [ThresholdIndex(get_price_per_point, values, at_most=True)]
+
+
+@indexes("points")
+def index_points(special_type, values):
+    return [ThresholdIndex(attrgetter("points"), values, at_most=False)]
+
+
+@indexes("resorts")
+def index_resorts(special_type, values):
+    return [MembershipIndex("resort_id", values)]
+
+
+@indexes("rooms")
+def index_rooms(special_type, values):
+    return [MembershipIndex("room_id", values)]
+
+
+@indexes("views")
+def index_views(special_type, values):
+    return [MembershipIndex("view_id", values)]
+
+
+# The columns of a 'SpecialColumns' that aren't an attribute of the special,
+# worked out from its other columns. These are the same as the 'get_' functions
+# for the indexes.
+
+
+def column_stay_check_in(columns):
+    return [
+        check_in
+        if check_in is not None
+        and check_out is not None
+        and check_in <= check_out
+        else None
+        for check_in, check_out in zip(
+            columns.column("check_in"), columns.column("check_out")
+        )
+    ]
+
+
+def column_stay_check_out(columns):
+    return [
+        check_out if check_in is not None else None
+        for check_in, check_out in zip(
+            columns.column("stay_check_in"), columns.column("check_out")
+        )
+    ]
+
+
+def column_duration(columns):
+    return [
+        (check_out - check_in).days
+        if check_in is not None and check_out is not None
+        else None
+        for check_in, check_out in zip(
+            columns.column("check_in"), columns.column("check_out")
+        )
+    ]
+
+
+def column_price_per_night(columns):
+    return [
+        price / duration if price is not None and duration else None
+        for price, duration in zip(
+            columns.column("price"), columns.column("duration")
+        )
+    ]
+
+
+def column_price_per_point(columns):
+    return [
+        price / points if price is not None and points else None
+        for price, points in zip(
+            columns.column("price"), columns.column("points")
+        )
+    ]
+
+
+derived_columns = {
+    "stay_check_in": column_stay_check_in,
+    "stay_check_out": column_stay_check_out,
+    "duration": column_duration,
+    "price_per_night": column_price_per_night,
+    "price_per_point": column_price_per_point,
+}
+
+
+# Each of the 'criteria_map' functions as a function that takes a
+# 'SpecialColumns', the special type and the criterion's value and returns the
+# mask of the specials that meet the criterion. Like the compiled criteria
+# these must give the same results as the 'criteria_map' functions, and return
+# None when the criterion can never be met for the special type.
+criteria_maskers = {}
+
+
+def masks(key):
+    def decorated_function(func):
+        criteria_maskers[key] = func
+        return func
+
+    return decorated_function
+
+
+@masks("date")
+def mask_date(columns, special_type, imp_date):
+    if "end" not in imp_date:
+        return None
+    end = imp_date["end"]
+    if special_type != SpecialTypes.PRECONFIRM:
+        return columns.threshold_mask("check_out", end, at_most=False)
+    if "start" not in imp_date:
+        return None
+    start = imp_date["start"]
+    if start > end:
+        return None
+    return columns.threshold_mask(
+        "stay_check_in", end, at_most=True
+    ) & columns.threshold_mask("stay_check_out", start, at_most=False)
+
+
+@masks("length_of_stay")
+def mask_length_of_stay(columns, special_type, value):
+    return columns.threshold_mask("duration", value, at_most=False)
+
+
+@masks("price")
+def mask_price(columns, special_type, value):
+    return columns.threshold_mask("price", value, at_most=True)
+
+
+@masks("price_per_night")
+def mask_price_per_night(columns, special_type, value):
+    return columns.threshold_mask("price_per_night", value, at_most=True)
+
+
+@masks("price_per_point")
+def mask_price_per_point(columns, special_type, value):
+    if special_type != SpecialTypes.PRECONFIRM:
+        return mask_price(columns, special_type, value)
+    return columns.threshold_mask("price_per_point", value, at_most=True)
+
+
+@masks("points")
+def mask_points(columns, special_type, value):
+    return columns.threshold_mask("points", value, at_most=False)
+
+
+@masks("resorts")
+def mask_resorts(columns, special_type, resorts):
+    return columns.values_mask("resort_id", resorts)
+
+
+@masks("rooms")
+def mask_rooms(columns, special_type, rooms):
+    return columns.values_mask("room_id", rooms)
+
+
+@masks("views")
+def mask_views(columns, special_type, views):
+    return columns.values_mask("view_id", views)
+
+
+# Each of the 'criteria_map' functions as a function that takes the special
+# type and the criterion's value and returns a SQL expression for StoredSpecial.
+# A NULL in a comparison is never true, which is the same as the None checks in
+# the 'criteria_map' functions. Like the compiled criteria these return None
+# when the criterion can never be met for the special type.
+criteria_clauses = {}
+
+
+def clauses(key):
+    def decorated_function(func):
+        criteria_clauses[key] = func
+        return func
+
+    return decorated_function
+
+
+@clauses("date")
+def date_clause(special_type, imp_date):
+    if "end" not in imp_date:
+        return None
+    end = imp_date["end"]
+    if special_type != SpecialTypes.PRECONFIRM:
+        return StoredSpecial.check_out >= end
+    if "start" not in imp_date:
+        return None
+    start = imp_date["start"]
+    if start > end:
+        return None
+    # The same as the ranges overlapping by at least one day
+    return db.and_(
+        StoredSpecial.check_in <= end,
+        StoredSpecial.check_out >= start,
+        StoredSpecial.check_in <= StoredSpecial.check_out,
+    )
+
+
+@clauses("length_of_stay")
+def length_of_stay_clause(special_type, value):
+    return StoredSpecial.duration >= value
+
+
+@clauses("price")
+def price_clause(special_type, value):
+    return StoredSpecial.price <= value
+
+
+@clauses("price_per_night")
+def price_per_night_clause(special_type, value):
+    return StoredSpecial.price_per_night <= value
+
+
+@clauses("price_per_point")
+def price_per_point_clause(special_type, value):
+    if special_type != SpecialTypes.PRECONFIRM:
+        return price_clause(special_type, value)
+    return StoredSpecial.price_per_point <= value
+
+
+@clauses("points")
+def points_clause(special_type, value):
+    return StoredSpecial.points >= value
+
+
+@clauses("resorts")
+def resorts_clause(special_type, resorts):
+    return StoredSpecial.resort_id.in_(set(resorts) - {None})
+
+
+@clauses("rooms")
+def rooms_clause(special_type, rooms):
+    return StoredSpecial.room_id.in_(set(rooms) - {None})
+
+
+@clauses("views")
+def views_clause(special_type, views):
+    return StoredSpecial.view_id.in_(set(views) - {None})
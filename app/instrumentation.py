@@ -0,0 +1,127 @@
+import heapq
+import time
+from itertools import count
+
+from flask import current_app, g, has_app_context, request
+
+from . import db
+
+
+class QueryStats:
+    """
+    The number of statements executed, the total time spent executing them
+    (in seconds) and the 'slowest' statements (as (seconds, statement)
+    tuples, slowest first).
+    """
+
+    def __init__(self, slowest=5):
+        self.count = 0
+        self.seconds = 0.0
+        self._max_slowest = slowest
+        self._slowest = []
+        self._order = count()
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if self._max_slowest <= 0:
+            return
+        item = (seconds, next(self._order), statement)
+        if len(self._slowest) < self._max_slowest:
+            heapq.heappush(self._slowest, item)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    @property
+    def slowest(self):
+        return [
+            (seconds, statement)
+            for seconds, _, statement in sorted(self._slowest, reverse=True)
+        ]
+
+    def format_slowest(self, width=200):
+        lines = []
+        for seconds, statement in self.slowest:
+            statement = " ".join(statement.split())
+            if len(statement) > width:
+                statement = statement[: width - 3] + "..."
+            lines.append(f"  {seconds * 1000:8.2f}ms  {statement}")
+        return "\n".join(lines)
+
+
+def before_cursor_execute(conn, cursor, statement, *args):
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, *args):
+    start_times = conn.info.get("query_start_times")
+    if not start_times:
+        return
+    seconds = time.perf_counter() - start_times.pop()
+    if not has_app_context():
+        return
+    stats = g.get("query_stats")
+    if stats is not None:
+        stats.add(statement, seconds)
+
+
+def listen_for_queries(engine):
+    """
+    Adds the statements executed with 'engine' to the QueryStats in
+    'g.query_stats', when there is one. Statements executed in an app context
+    without one (like the parser threads') are not counted.
+    """
+    if not db.event.contains(
+        engine, "before_cursor_execute", before_cursor_execute
+    ):
+        db.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        db.event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def start_query_stats():
+    """
+    Starts collecting QueryStats for the current app context and returns
+    them.
+    """
+    listen_for_queries(db.engine)
+    g.query_stats = QueryStats(current_app.config["SQL_SLOWEST_QUERIES"])
+    return g.query_stats
+
+
+def stop_query_stats():
+    return g.pop("query_stats", None)
+
+
+def init_app(app):
+    """
+    Collects the QueryStats of every request. The count and time are added
+    to the response in the 'X-Query-Count' and 'Server-Timing' headers and
+    are logged. When a request makes more than 'SQL_QUERY_WARNING_THRESHOLD'
+    queries a warning is logged with its slowest statements.
+    """
+
+    @app.before_request
+    def before_request():
+        start_query_stats()
+
+    @app.after_request
+    def after_request(response):
+        stats = stop_query_stats()
+        if stats is None:
+            return response
+        response.headers["X-Query-Count"] = str(stats.count)
+        response.headers.add(
+            "Server-Timing", f'db;dur={stats.seconds * 1000:.2f};desc="SQL"'
+        )
+        app.logger.info(
+            f"{request.method} {request.path}: {stats.count} queries in "
+            f"{stats.seconds * 1000:.2f}ms"
+        )
+        threshold = app.config["SQL_QUERY_WARNING_THRESHOLD"]
+        if threshold and stats.count > threshold:
+            app.logger.warning(
+                f"{request.method} {request.path} made {stats.count} queries "
+                f"(more than {threshold}), the slowest were:\n"
+                f"{stats.format_slowest()}"
+            )
+        return response
@@ -2,9 +2,9 @@ from flask import current_app, render_template
 
 from ...auth import auth
 from ...models import StoredSpecial as Special
-from ...models import db
+from ...models import UserSpecialMatch, db
 from ...util import test_old_values
-from ..util import is_important_special
+from ..util import with_important_flags
 from . import specials
 
 
@@ -14,9 +14,7 @@ def current_specials():
     specials = db.session.scalars(
         db.select(Special).order_by(Special.check_in, Special.check_out)
     )
-    all_stored_specials = [
-        (special, is_important_special(special)) for special in specials
-    ]
+    all_stored_specials = with_important_flags(specials)
     return render_template(
         "specials/email_template.html",
         specials_group=(("All", all_stored_specials),),
@@ -28,11 +26,12 @@ def current_specials():
 @auth.login_required
 def current_important_specials():
     specials = db.session.scalars(
-        db.select(Special).order_by(Special.check_in, Special.check_out)
+        db.select(Special)
+        .join(UserSpecialMatch)
+        .where(UserSpecialMatch.user_id == auth.current_user().user_id)
+        .order_by(Special.check_in, Special.check_out)
     )
-    all_stored_specials = [
-        (special, True) for special in specials if is_important_special(special)
-    ]
+    all_stored_specials = [(special, True) for special in specials]
     return render_template(
         "specials/email_template.html",
         specials_group=(("Important", all_stored_specials),),
@@ -48,9 +47,7 @@ def current_error_specials():
         .filter_by(error=True)
         .order_by(Special.check_in, Special.check_out)
     )
-    all_stored_specials = [
-        (special, is_important_special(special)) for special in specials
-    ]
+    all_stored_specials = with_important_flags(specials)
     return render_template(
         "specials/email_template.html",
         specials_group=(("Errors", all_stored_specials),),
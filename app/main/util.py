@@ -2,7 +2,7 @@ from flask import g
 from werkzeug.local import LocalProxy
 
 from ..auth import auth
-from ..criteria import ImportantCriteria
+from ..criteria import ImportantCriteria, SpecialColumns
 from ..models import Category
 from ..util import ContactTypes
 
@@ -21,6 +21,16 @@ def get_important_special():
 is_important_special = LocalProxy(get_important_special)
 
 
+def with_important_flags(specials):
+    """
+    Pairs each of 'specials' with whether it is important to the current user,
+    checking the user's criteria against all of them at once.
+    """
+    columns = SpecialColumns(specials)
+    important_mask = is_important_special.important_mask(columns)
+    return list(zip(columns.specials, columns.flags(important_mask)))
+
+
 class CategoryChoices:
     none_id = None
     sort_key = staticmethod(lambda x: x.name)
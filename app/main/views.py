@@ -4,6 +4,8 @@ from flask import current_app, flash, render_template
 
 from .. import db
 from ..auth import auth
+from ..criteria import ImportantCriteria
+from ..matches import rebuild_user_matches
 from ..models import CategoryModelLoader
 from . import main
 from .forms import ImportantCriteriaListForm
@@ -39,6 +41,7 @@ def current_important_criteria():
         criteria = form.to_json()
         if criteria:
             user.important_criteria = criteria
+            rebuild_user_matches(user.user_id, ImportantCriteria(criteria))
         flash("Successfully Updated Important Criteria!", "success")
     return render_template(
         "criteria/criteria_template.html",
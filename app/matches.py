@@ -0,0 +1,114 @@
+from collections import defaultdict
+
+from . import db
+from .criteria import CriteriaIndex, ImportantCriteria
+from .models import StoredSpecial, UserSpecialMatch
+
+
+def get_criteria_index(users):
+    """
+    A CriteriaIndex of the criteria of 'users', by user_id.
+    """
+    return CriteriaIndex(
+        {
+            user.user_id: ImportantCriteria(user.important_criteria)
+            for user in users
+        }
+    )
+
+
+def add_matches(criteria_index, specials):
+    """
+    Finds the users each of 'specials' is important to with 'criteria_index'
+    (a CriteriaIndex by user_id) and stores the matches. Returns the specials
+    that are important to each user, in the same order as 'specials', in a
+    dictionary by user_id.
+    """
+    matches = defaultdict(list)
+    rows = []
+    for special in specials:
+        for user_id, block in criteria_index.match_blocks(special).items():
+            matches[user_id].append(special)
+            rows.append(
+                {
+                    "user_id": user_id,
+                    "special_id": special.special_id,
+                    "criteria_block": block,
+                }
+            )
+    if rows:
+        db.session.execute(db.insert(UserSpecialMatch.__table__), rows)
+    return matches
+
+
+def remove_matches(specials, batch_size=500):
+    """
+    Deletes the stored matches of 'specials', in batches of 'batch_size' so
+    the IN lists stay small. Returns the specials that were important to each
+    user, in the same order as 'specials', in a dictionary by user_id.
+    """
+    special_ids = [special.special_id for special in specials]
+    user_ids = defaultdict(list)
+    table = UserSpecialMatch.__table__
+    for i in range(0, len(special_ids), batch_size):
+        for user_id, special_id in db.session.execute(
+            db.delete(table)
+            .where(table.c.special_id.in_(special_ids[i : i + batch_size]))
+            .returning(table.c.user_id, table.c.special_id)
+        ):
+            user_ids[special_id].append(user_id)
+
+    matches = defaultdict(list)
+    for special in specials:
+        for user_id in user_ids.get(special.special_id, ()):
+            matches[user_id].append(special)
+    return matches
+
+
+def query_match_rows(where_clause=None):
+    """
+    The values of the StoredSpecials (that match 'where_clause') that are
+    needed to match them, rather than the StoredSpecials themselves.
+    """
+    query = db.select(
+        StoredSpecial.special_id,
+        StoredSpecial.type,
+        StoredSpecial.points,
+        StoredSpecial.price,
+        StoredSpecial.check_in,
+        StoredSpecial.check_out,
+        StoredSpecial.resort_id,
+        StoredSpecial.room_id,
+        StoredSpecial.view_id,
+    )
+    if where_clause is not None:
+        query = query.where(where_clause)
+    return db.session.execute(query)
+
+
+def rebuild_user_matches(user_id, important_criteria):
+    """
+    Replaces the stored matches of one user with the ones for
+    'important_criteria' (an ImportantCriteria). Only the specials that match
+    are read from the database (see 'ImportantCriteria.where_clause').
+    """
+    # Both of these are made before anything is queried. Flushing the user
+    # changes their criteria in place (see 'User.ImportantCriteriaType').
+    criteria_index = CriteriaIndex({user_id: important_criteria})
+    where_clause = important_criteria.where_clause()
+    db.session.execute(
+        db.delete(UserSpecialMatch.__table__).where(
+            UserSpecialMatch.user_id == user_id
+        )
+    )
+    add_matches(criteria_index, query_match_rows(where_clause))
+
+
+def rebuild_matches(users):
+    """
+    Replaces all of the stored matches with the ones for the criteria of
+    'users'.
+    """
+    criteria_index = get_criteria_index(users)
+    db.session.execute(db.delete(UserSpecialMatch.__table__))
+    add_matches(criteria_index, query_match_rows())
@@ -0,0 +1,164 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, g
+
+from . import db
+from .instrumentation import start_query_stats, stop_query_stats
+from .models import UpdateRun
+
+
+class RunMetrics:
+    """
+    Collects how long each stage of an 'update-specials' run takes, the counts
+    of what changed, how many bytes were downloaded and how many queries were
+    made (see 'QueryStats', these are only collected when
+    'SQL_INSTRUMENTATION' is on). When the run is finished it is saved as an
+    UpdateRun.
+    """
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.started_at = datetime.utcnow()
+        self.stage_durations = {}
+        self.counts = {}
+        self.bytes_downloaded = 0
+        self.query_stats = None
+        self._start = time.perf_counter()
+
+    def add_duration(self, stage, seconds):
+        self.stage_durations[stage] = (
+            self.stage_durations.get(stage, 0) + seconds
+        )
+
+    @property
+    def query_count(self):
+        return self.query_stats.count if self.query_stats else None
+
+    @property
+    def db_seconds(self):
+        return self.query_stats.seconds if self.query_stats else None
+
+    def start(self):
+        if current_app.config["SQL_INSTRUMENTATION"]:
+            self.query_stats = start_query_stats()
+
+    def stop(self):
+        if self.query_stats is not None:
+            stop_query_stats()
+
+    def save(self):
+        duration = time.perf_counter() - self._start
+        db.session.add(
+            UpdateRun(
+                run_id=self.run_id,
+                started_at=self.started_at,
+                finished_at=datetime.utcnow(),
+                duration=duration,
+                stage_durations=self.stage_durations,
+                new_count=self.counts.get("new", 0),
+                updated_count=self.counts.get("updated", 0),
+                removed_count=self.counts.get("removed", 0),
+                error_count=self.counts.get("errors", 0),
+                bytes_downloaded=self.bytes_downloaded,
+                query_count=self.query_count,
+                db_seconds=self.db_seconds,
+            )
+        )
+        db.session.commit()
+        if self.query_stats is None:
+            print(f"Update took {duration:.2f}s (run {self.run_id}).")
+            return
+        print(
+            f"Update took {duration:.2f}s with {self.query_count} queries "
+            f"taking {self.db_seconds:.2f}s (run {self.run_id})."
+        )
+        print("Slowest queries:")
+        print(self.query_stats.format_slowest())
+
+
+@contextmanager
+def run_stage(stage):
+    """
+    Adds the time spent in the 'with' block to 'stage' of the current run's
+    metrics. When there aren't any metrics being collected this does nothing.
+    """
+    metrics = g.get("run_metrics")
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_duration(stage, time.perf_counter() - start)
+
+
+def percentile(values, percent):
+    """
+    Returns the 'percent' percentile of 'values', interpolating between the
+    two closest values.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def get_run_stats(runs):
+    """
+    Returns (name, is_duration, p50, p95, trend) for the total duration,
+    every stage and every count of 'runs' (oldest first). The trend is how
+    much the p50 of the newer half of the runs changed from the p50 of the
+    older half, it is None when there aren't enough runs to tell.
+    """
+    series = {"duration": (True, [run.duration for run in runs])}
+    # The queries are only counted for the runs with 'SQL_INSTRUMENTATION' on
+    db_seconds = [run.db_seconds for run in runs if run.db_seconds is not None]
+    if db_seconds:
+        series["db_seconds"] = (True, db_seconds)
+    stages = sorted(
+        {stage for run in runs for stage in (run.stage_durations or {})}
+    )
+    for stage in stages:
+        series[stage] = (
+            True,
+            [(run.stage_durations or {}).get(stage, 0) for run in runs],
+        )
+    for column in (
+        "new_count",
+        "updated_count",
+        "removed_count",
+        "error_count",
+        "bytes_downloaded",
+    ):
+        series[column] = (False, [getattr(run, column) or 0 for run in runs])
+    query_counts = [
+        run.query_count for run in runs if run.query_count is not None
+    ]
+    if query_counts:
+        series["query_count"] = (False, query_counts)
+
+    stats = []
+    for name, (is_duration, values) in series.items():
+        trend = None
+        half = len(values) // 2
+        if half >= 2:
+            older = percentile(values[:half], 50)
+            newer = percentile(values[half:], 50)
+            if older:
+                trend = (newer - older) / older
+        stats.append(
+            (
+                name,
+                is_duration,
+                percentile(values, 50),
+                percentile(values, 95),
+                trend,
+            )
+        )
+    return stats
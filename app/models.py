@@ -2,7 +2,10 @@ from datetime import date, datetime
 
 import tomlkit
 from sqlalchemy import orm
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.hybrid import HybridExtensionType, hybrid_property
+from sqlalchemy.sql.functions import FunctionElement
 from werkzeug.datastructures import MultiDict
 from werkzeug.utils import cached_property
 
@@ -13,11 +16,41 @@ from .util import (
     ContactTypes,
     InheritedModelLoader,
     ProxyAttribute,
+    SpecialEventTypes,
     SpecialTypes,
     first_index_or_none,
+    plain_value,
+    special_fingerprint,
 )
 
 
+class days_between(FunctionElement):
+    """
+    The number of days from the first date to the second in SQL, like
+    subtracting two dates in Python. SQLite doesn't have a date type, so it
+    needs to turn them into day numbers first.
+    """
+
+    type = db.Integer()
+    name = "days_between"
+    inherit_cache = True
+
+
+@compiles(days_between)
+def compile_days_between(element, compiler, **kw):
+    start, end = element.clauses
+    return f"({compiler.process(end, **kw)} - {compiler.process(start, **kw)})"
+
+
+@compiles(days_between, "sqlite")
+def compile_days_between_sqlite(element, compiler, **kw):
+    start, end = element.clauses
+    return (
+        f"CAST(julianday({compiler.process(end, **kw)}) - "
+        f"julianday({compiler.process(start, **kw)}) AS INTEGER)"
+    )
+
+
 @orm.declarative_mixin
 class StaticDataMixin:
     static_index = db.Column(db.Integer)
@@ -51,6 +84,7 @@ class StaticDataMixin:
                     db.session.delete(old_item)
 
                 db.session.commit()
+                ProxyConversionMixin.clear_characteristics()
             else:
                 print(f"No static data found for '{cls._static_data_name}'")
 
@@ -62,6 +96,16 @@ class StaticDataMixin:
 
 
 class ProxyConversionMixin:
+    """
+    Converts ProxyAttributes into the Characteristic they stand for. All the
+    Characteristics are loaded with one query the first time one is needed
+    and then kept in the session's 'info', which for the CLI commands is the
+    whole run, so converting a proxy doesn't need to go to the database.
+    Since they are kept with the session they are never used once they are
+    detached from it (i.e. after 'db.session.remove()'), and they are
+    dropped when the session is rolled back.
+    """
+
     @classmethod
     def convert_proxy(cls, proxy):
         orm_attr = getattr(cls, proxy.attr, None)
@@ -71,15 +115,34 @@ class ProxyConversionMixin:
             orm.configure_mappers()
             orm_attr = getattr(cls, proxy.attr)
         model = orm_attr.mapper.class_
-        with db.session.no_autoflush:
-            entity = db.session.get(model, proxy.id)
-        if entity is None:
+        entity = cls.get_characteristics().get(proxy.id)
+        if not isinstance(entity, model):
             raise RuntimeError(
                 f"Proxy object '{proxy}' could not be successfully converted.\n"
                 f"Check if '{proxy.id}' needs to be added into 'static_data.toml'"
             )
         return entity
 
+    @staticmethod
+    def get_characteristics():
+        characteristics = db.session.info.get("characteristics")
+        if characteristics is None:
+            with db.session.no_autoflush:
+                characteristics = {
+                    characteristic.characteristic_id: characteristic
+                    for characteristic in db.session.scalars(
+                        db.select(Characteristic)
+                    )
+                }
+            db.session.info["characteristics"] = characteristics
+        return characteristics
+
+    @staticmethod
+    def clear_characteristics(session=None):
+        if session is None:
+            session = db.session
+        session.info.pop("characteristics", None)
+
 
 class DefaultEntityMixin:
     class DefaultEntity:
@@ -103,6 +166,10 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
     ParsedSpecial object which represents the Specials as they are parsed from
     html. This object represents the specials as they are stored in the
     database.
+
+    'fingerprint' is a hash of all the core attributes (see
+    'special_fingerprint'), so checking if a special has changed only needs
+    to compare it with the fingerprint of the ParsedSpecial.
     """
 
     __tablename__ = "stored_specials"
@@ -134,6 +201,7 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
         db.ForeignKey("characteristics.characteristic_id", ondelete="SET NULL"),
     )
     error = db.Column(db.Boolean, default=False)
+    fingerprint = db.Column(db.String(64))
 
     attribute_deps = MultiDict()
 
@@ -151,7 +219,7 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
 
     @duration.expression
     def duration(cls):
-        return cls.check_out - cls.check_in
+        return days_between(cls.check_in, cls.check_out)
 
     @hybrid_property
     def price_per_night(self):
@@ -159,12 +227,20 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
             return None
         return self.price / self.duration
 
+    @price_per_night.expression
+    def price_per_night(cls):
+        return db.case((cls.duration != 0, cls.price / cls.duration))
+
     @hybrid_property
     def price_per_point(self):
         if self.price is None or self.points is None or self.points == 0:
             return None
         return self.price / self.points
 
+    @price_per_point.expression
+    def price_per_point(cls):
+        return db.case((cls.points != 0, cls.price / cls.points))
+
     @property
     def price_increased(self):
         if (
@@ -202,7 +278,8 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
             value = getattr(parsed_special, key, None)
             if isinstance(value, ProxyAttribute):
                 value = cls.convert_proxy(value)
-            setattr(new_special, key, value)
+            new_special.set_core_value(key, value)
+        new_special.update_fingerprint()
         return new_special
 
     def update_with_special(self, other):
@@ -218,7 +295,7 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
                 new_value = self.convert_proxy(new_value)
             if new_value != stored_value:
                 self.set_old_key(key)
-                setattr(self, key, new_value)
+                self.set_core_value(key, new_value)
 
         # Check if every old_key is necessary. If multiple things change we may
         # store an old key unnecessarily.
@@ -229,6 +306,118 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
             ):
                 delattr(self, old_key)
 
+        self.update_fingerprint()
+
+    def update_fingerprint(self):
+        self.fingerprint = special_fingerprint(self)
+
+    def set_core_value(self, key, value):
+        """
+        Sets the core attribute 'key'. The resort, room & view relationships
+        are set without any events, otherwise the backref adds the special to
+        the Characteristic's 'specials', which the session then tries (and
+        fails) to save it through. StoredSpecials are written with the bulk
+        methods, which take the foreign keys from these relationships. The
+        foreign key is kept in step here as well, since the ORM only does that
+        when it flushes (i.e. 'resort_id' is what the criteria check).
+        """
+        relationship = db.inspect(type(self)).relationships.get(key)
+        if relationship is not None:
+            orm.attributes.set_committed_value(self, key, value)
+            (column,) = relationship.local_columns
+            setattr(
+                self,
+                column.key,
+                value.characteristic_id if value is not None else None,
+            )
+        else:
+            setattr(self, key, value)
+
+    def get_changed_keys(self):
+        """
+        Yields the core keys that were changed by 'update_with_special'.
+        """
+        return (
+            key for key in self.get_core_keys() if hasattr(self, f"old_{key}")
+        )
+
+    def get_row(self):
+        """
+        Returns the values of all the columns. The foreign keys are taken from
+        the relationships, since the ORM only sets those when it flushes.
+        """
+        inspector = db.inspect(type(self))
+        row = {
+            column.key: getattr(self, column.key)
+            for column in inspector.c
+            if not column.foreign_keys
+        }
+        for relationship in inspector.relationships:
+            (column,) = relationship.local_columns
+            characteristic = getattr(self, relationship.key)
+            row[column.key] = (
+                characteristic.characteristic_id
+                if characteristic is not None
+                else None
+            )
+        return row
+
+    @classmethod
+    def bulk_insert(cls, specials):
+        """
+        Inserts 'specials' (which must not be in the session) all at once,
+        rather than one INSERT each when the session is flushed.
+        """
+        rows = [special.get_row() for special in specials]
+        if rows:
+            db.session.execute(db.insert(cls.__table__), rows)
+
+    @classmethod
+    def bulk_update(cls, specials):
+        """
+        Writes the values of 'specials' to the database all at once. They
+        are removed from the session first, so the session doesn't write them
+        again when it is flushed. On PostgreSQL this is a multi-row
+        INSERT ... ON CONFLICT DO UPDATE, otherwise it is an executemany
+        UPDATE by special_id.
+        """
+        rows = [special.get_row() for special in specials]
+        if not rows:
+            return
+        for special in specials:
+            db.session.expunge(special)
+        if db.session.get_bind().dialect.name == "postgresql":
+            statement = postgresql.insert(cls.__table__)
+            statement = statement.on_conflict_do_update(
+                index_elements=[cls.__table__.c.special_id],
+                set_={
+                    key: statement.excluded[key]
+                    for key in rows[0]
+                    if key != "special_id"
+                },
+            )
+            db.session.execute(statement, rows)
+        else:
+            db.session.execute(db.update(cls), rows)
+
+    @classmethod
+    def bulk_delete(cls, specials, batch_size=500):
+        """
+        Deletes 'specials' with one DELETE for every 'batch_size' of them.
+        They are removed from the session, but can still be used afterwards.
+        """
+        special_ids = [special.special_id for special in specials]
+        for special in specials:
+            db.session.expunge(special)
+        for i in range(0, len(special_ids), batch_size):
+            db.session.execute(
+                db.delete(cls.__table__).where(
+                    cls.__table__.c.special_id.in_(
+                        special_ids[i : i + batch_size]
+                    )
+                )
+            )
+
     def set_old_key(self, key):
         dependents = self.attribute_deps.getlist(key)
         if dependents:
@@ -279,11 +468,11 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
         against another special.
 
         We want this to only yield columns that are not foreign keys and also
-        relationships.
+        relationships. The fingerprint is made from these, so it isn't one.
         """
         inspector = db.inspect(cls)
         for column in inspector.c:
-            if not column.foreign_keys:
+            if not column.foreign_keys and column.key != "fingerprint":
                 yield column.key
         for relationship in inspector.relationships:
             yield relationship.key
@@ -301,7 +490,8 @@ class StoredSpecial(ProxyConversionMixin, db.Model):
     def get_attribute_deps(cls, attribute):
         dependors = attribute.get_children()
         if not dependors:
-            return [attribute.key]
+            # Anything else, like a literal value, isn't an attribute
+            return [attribute.key] if isinstance(attribute, db.Column) else []
         attr_deps = []
         for dependor in dependors:
             attr_deps += cls.get_attribute_deps(dependor)
@@ -569,12 +759,153 @@ class ParserStatus(db.Model):
     deleted when something wrong happens with the site they are from. If they
     all disappear and reappear it results in unnecessary notifications being
     sent.
+
+    The content_fingerprint is the fingerprint of the specials the Parser found
+    the last time it ran. When it finds the exact same specials again, they
+    don't need to be processed or checked for changes.
     """
 
     parser_status_id = db.Column(db.Integer, primary_key=True)
     parser_source = db.Column(db.String(32), unique=True)
     healthy = db.Column(db.Boolean)
     empty_okay = db.Column(db.Boolean, default=False)
+    content_fingerprint = db.Column(db.String(64))
+
+
+class SpecialEvent(db.Model):
+    """
+    The history of the changes to the specials, rows are only ever added.
+    Every update adds one for each special that was added, updated or
+    removed, all with the same 'run_id'. An added special only has
+    'new_values' and a removed special only has 'old_values', both with all
+    of the core attributes. An updated special has both, but only with the
+    attributes that changed. Characteristics are stored by their id.
+    """
+
+    __tablename__ = "special_events"
+    __table_args__ = (
+        db.Index(
+            "ix_special_events_special_id_created_at",
+            "special_id",
+            "created_at",
+        ),
+    )
+    special_event_id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(32), index=True)
+    special_id = db.Column(db.String(), nullable=False)
+    source = db.Column(db.String(32))
+    event_type = db.Column(db.Enum(SpecialEventTypes), nullable=False)
+    old_values = db.Column(db.JSON(none_as_null=True))
+    new_values = db.Column(db.JSON(none_as_null=True))
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow, index=True)
+
+    @classmethod
+    def record(cls, added, updated, removed, run_id):
+        """
+        Adds the events for the 'added', 'updated' and 'removed'
+        StoredSpecials all at once.
+        """
+        created_at = datetime.utcnow()
+        rows = []
+        for special in added:
+            rows.append(
+                cls.get_row(
+                    special,
+                    SpecialEventTypes.ADDED,
+                    run_id,
+                    created_at,
+                    new_values=cls.get_values(special, special.get_core_keys()),
+                )
+            )
+        for special in updated:
+            keys = list(special.get_changed_keys())
+            rows.append(
+                cls.get_row(
+                    special,
+                    SpecialEventTypes.UPDATED,
+                    run_id,
+                    created_at,
+                    old_values=cls.get_values(special, keys, prefix="old_"),
+                    new_values=cls.get_values(special, keys),
+                )
+            )
+        for special in removed:
+            rows.append(
+                cls.get_row(
+                    special,
+                    SpecialEventTypes.REMOVED,
+                    run_id,
+                    created_at,
+                    old_values=cls.get_values(special, special.get_core_keys()),
+                )
+            )
+        if rows:
+            db.session.execute(db.insert(cls.__table__), rows)
+
+    @staticmethod
+    def get_row(
+        special,
+        event_type,
+        run_id,
+        created_at,
+        old_values=None,
+        new_values=None,
+    ):
+        return {
+            "run_id": run_id,
+            "special_id": special.special_id,
+            "source": special.source,
+            "event_type": event_type,
+            "old_values": old_values,
+            "new_values": new_values,
+            "created_at": created_at,
+        }
+
+    @staticmethod
+    def get_values(special, keys, prefix=""):
+        return {
+            key: plain_value(getattr(special, f"{prefix}{key}")) for key in keys
+        }
+
+
+class UpdateRun(db.Model):
+    """
+    The metrics of one run of 'update-specials': how long the whole run and
+    each of its stages took (in seconds), the counts of the specials that
+    were added, updated, removed or have an error, the bytes downloaded by
+    the parsers and the number of queries made along with the time spent
+    making them. 'run_id' is the same as the 'run_id' of the SpecialEvents
+    from the run.
+    """
+
+    __tablename__ = "update_runs"
+    run_id = db.Column(db.String(32), primary_key=True)
+    started_at = db.Column(db.DateTime(), index=True)
+    finished_at = db.Column(db.DateTime())
+    duration = db.Column(db.Float)
+    stage_durations = db.Column(db.JSON)
+    new_count = db.Column(db.Integer)
+    updated_count = db.Column(db.Integer)
+    removed_count = db.Column(db.Integer)
+    error_count = db.Column(db.Integer)
+    bytes_downloaded = db.Column(db.BigInteger)
+    query_count = db.Column(db.Integer)
+    db_seconds = db.Column(db.Float)
+
+
+class ResponseValidator(db.Model):
+    """
+    The model for the 'ETag' and 'Last-Modified' values of the last response a
+    Parser received for a request (url & params). These are sent with the next
+    request so the site can respond with a 304 if nothing has changed, in which
+    case the stored specials are still current and the Parser is skipped.
+    """
+
+    __tablename__ = "response_validators"
+    request_key = db.Column(db.String(), primary_key=True)
+    parser_source = db.Column(db.String(32), index=True)
+    etag = db.Column(db.String())
+    last_modified = db.Column(db.String())
 
 
 class Contact(db.Model):
@@ -608,6 +939,9 @@ class Contact(db.Model):
 
 
 db.event.listen(Contact.contact, "set", Contact.on_set_contact, propagate=True)
+db.event.listen(
+    orm.Session, "after_rollback", ProxyConversionMixin.clear_characteristics
+)
 
 
 class Email(Contact):
@@ -824,3 +1158,28 @@ class User(db.Model):
 
     def __repr__(self):
         return f"<User: {self.username}>"
+
+
+class UserSpecialMatch(db.Model):
+    """
+    A special that is important to a user. 'criteria_block' is the index of
+    the first of the user's criteria blocks (for the special's type) that it
+    matched. These are kept up to date as the specials are updated and when a
+    user saves their criteria (see 'matches.py'), so the specials that are
+    important to a user don't have to be found again each time they are
+    needed.
+    """
+
+    __tablename__ = "user_special_matches"
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.user_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    special_id = db.Column(
+        db.String,
+        db.ForeignKey("stored_specials.special_id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    criteria_block = db.Column(db.Integer, nullable=False)
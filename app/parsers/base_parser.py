@@ -1,14 +1,22 @@
 import hashlib
-import random
+import json
+import tempfile
+import threading
 import time
 from functools import wraps
 
-import requests
+import httpx
 
 from ..errors import SpecialError
+from ..util import special_fingerprint
+from .http_client import get_parser_client
 
 
 class BaseParser(object):
+    # How big the raw specials can get in memory while they are fingerprinted,
+    # beyond this they are written to disk (see 'get_all_specials')
+    spool_max_size = 1024 * 1024
+
     def __init__(
         self,
         source,
@@ -24,7 +32,17 @@ class BaseParser(object):
         self.data_url = data_url
         self.headers = headers
         self.params = params
+        self.client = get_parser_client()
+        self.response_validators = None
+        self.not_modified = False
+        self.previous_fingerprint = None
+        self.content_fingerprint = None
         self.current_error = None
+        # How long was spent waiting on the site and how much was downloaded,
+        # requests can be made from more than one thread so these are locked
+        self.fetch_seconds = 0.0
+        self.bytes_downloaded = 0
+        self._download_lock = threading.Lock()
 
     def new_parsed_special(self):
         """
@@ -43,45 +61,182 @@ class BaseParser(object):
 
         This is the entry point to the parser from the rest of the app.
         The 'update-specials' CLI command calls this method to retrieve the
-        ParsedSpecial dictionary for all parsers.
+        ParsedSpecial dictionary for all parsers. If the site responded that
+        nothing has changed since the last time it was retrieved, or the
+        specials are exactly the same as they were then (their fingerprint
+        matches 'self.previous_fingerprint'), None is returned instead. The
+        fingerprint is of the raw specials, so when it matches none of them
+        are parsed.
         """
         if local_specials is not None:
             specials_content = self.get_local_specials_page(local_specials)
         else:
-            specials_content = self.get_specials_page()
+            specials_content = self.get_specials_content()
+
+        if self.not_modified:
+            print(f"'{self.source}' has not changed since the last update.")
+            return None
 
         if specials_content is None:
             return {}
 
-        specials_dict = self.process_specials_content(specials_content)
+        fingerprint = ContentFingerprint()
+        specials_list = self.get_specials_list(specials_content)
+        if self.previous_fingerprint is None:
+            # There is nothing to compare with (i.e. with '--force'), so the
+            # specials are parsed one at a time as they are decoded
+            specials_dict = collect_specials(
+                self.process_specials_list(fingerprint.iter(specials_list))
+            )
+            self.content_fingerprint = fingerprint.hexdigest()
+            return specials_dict
+
+        # The raw specials are hashed as they are decoded, before any of them
+        # are parsed. The fingerprint is only known once all of them have
+        # been seen, so until then they are written to a file that is only
+        # kept in memory while it is smaller than 'spool_max_size'. They are
+        # read back and parsed only if the fingerprints are different.
+        with tempfile.SpooledTemporaryFile(
+            max_size=self.spool_max_size, mode="w+", encoding="utf-8"
+        ) as spool:
+            fingerprint.spool(specials_list, spool)
+            self.content_fingerprint = fingerprint.hexdigest()
+            if self.content_fingerprint == self.previous_fingerprint:
+                print(
+                    f"'{self.source}' specials are the same as the last update."
+                )
+                return None
+
+            spool.seek(0)
+            return collect_specials(
+                self.process_specials_list(json.loads(line) for line in spool)
+            )
 
-        return specials_dict
+    def get_specials_content(self):
+        """
+        Retrieves the content that is passed to 'process_specials_content'. By
+        default this is the same as 'get_specials_page', subclasses can
+        override this to return content that is still being retrieved (i.e. a
+        generator), so work can start before all of it has arrived.
+        """
+        return self.get_specials_page()
 
     def get_specials_page(self):
         """
-        This retrieves the content from the webpage located at 'self.url'. A
-        User-Agent is set because some sites might not respond to 'requests'.
-        If the request is successful the data is returned as bytes. In
-        the event of a 500, 502, 503, or 504 response error, the request is
-        retried with backoff and jitter, at most 5 times. For more information
-        about why that is implemented visit:
-        https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+        This retrieves the content from the webpage located at 'self.url'. The
+        data is returned as text.
+
+        When 'self.response_validators' is set, the 'ETag' and 'Last-Modified'
+        values from the last time this page was retrieved are sent with the
+        request. If the server responds that the page has not been modified,
+        'self.not_modified' is set and None is returned.
         """
-        retries = 0
+        response = self.request_specials_page()
+        if response is None:
+            return None
+        return response.text
+
+    def stream_specials_page(self):
+        """
+        The same as 'get_specials_page', except the text is returned as a
+        generator of chunks that are handed back as they are downloaded. The
+        connection is closed once all of the chunks have been read or the
+        generator is closed, whichever happens first.
+        """
+        response = self.request_specials_page(stream=True)
+        if response is None:
+            return None
+        return self.iter_response_text(response)
+
+    def request_specials_page(self, stream=False):
         print(f"Retrieving Specials from {self.source}")
-        while retries < 5:
-            if retries > 0:
-                time.sleep(random.uniform(0, 2**retries))
-                print(f"Attempting Retry on Specials Request: {retries}")
-            url = self.data_url if self.data_url is not None else self.site_url
-            dvc_page = requests.get(
-                url, headers=self.headers, params=self.params
-            )
-            if dvc_page.status_code in (500, 502, 503, 504):
-                retries += 1
-            else:
-                break
-        return dvc_page.text
+        request_key = self.get_request_key()
+        response = self.get_response(
+            headers=self.get_conditional_headers(request_key), stream=stream
+        )
+        if response.status_code == 304:
+            response.close()
+            self.not_modified = True
+            return None
+        self.update_response_validators(request_key, response)
+        return response
+
+    def iter_response_text(self, response):
+        chunks = response.iter_text()
+        try:
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                self.record_download(time.perf_counter() - start)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            response.close()
+            self.record_download(0, response.num_bytes_downloaded)
+
+    def record_download(self, seconds, num_bytes=0):
+        with self._download_lock:
+            self.fetch_seconds += seconds
+            self.bytes_downloaded += num_bytes
+
+    @property
+    def url(self):
+        return self.data_url if self.data_url is not None else self.site_url
+
+    def get_response(self, params=None, headers=None, stream=False):
+        """
+        Requests 'self.url' with 'params', or 'self.params' if no params are
+        given. A User-Agent is set because some sites might not respond
+        otherwise. The request goes through the shared ParserHTTPClient, which
+        takes care of timeouts and retrying failed requests.
+        """
+        if params is None:
+            params = self.params
+        if headers is not None:
+            headers = (self.headers or {}) | headers
+        else:
+            headers = self.headers
+        start = time.perf_counter()
+        response = self.client.get(
+            self.url, headers=headers, params=params, stream=stream
+        )
+        # A streamed response's bytes are counted as they are read
+        self.record_download(
+            time.perf_counter() - start,
+            0 if stream else response.num_bytes_downloaded,
+        )
+        return response
+
+    def get_request_key(self, params=None):
+        """
+        The key the response validators of a request are stored under, this is
+        the url with the (sorted) params.
+        """
+        if params is None:
+            params = self.params
+        return str(httpx.URL(self.url, params=sorted((params or {}).items())))
+
+    def get_conditional_headers(self, request_key):
+        if self.response_validators is None:
+            return None
+        etag, last_modified = self.response_validators.get(
+            request_key, (None, None)
+        )
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def update_response_validators(self, request_key, response):
+        if self.response_validators is None:
+            return
+        self.response_validators[request_key] = (
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
 
     def get_local_specials_page(self, filename):
         """
@@ -92,6 +247,16 @@ class BaseParser(object):
         with open(filename, "rb") as f:
             return f.read()
 
+    def stream_local_specials_page(self, filename, chunk_size=65536):
+        """
+        The same as 'get_local_specials_page', except the text is returned as
+        a generator of chunks that are read from the file as they are needed.
+        """
+        print(f"Retrieving specials locally from file '{filename}'")
+        with open(filename, "r", encoding="utf-8") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
     def pop_current_error(self):
         """
         Returns 'self.current_error' and sets it to None. This is useful so the
@@ -103,56 +268,188 @@ class BaseParser(object):
         self.current_error = None
         return current_error
 
-    def process_specials_content(self, specials_content):
+    def get_specials_list(self, specials_content):
+        """
+        Extracts the specials, before they are parsed, from the content. This
+        can return any iterable (i.e. a generator that decodes them one at a
+        time). Each item gets passed to 'process_element'.
+        """
         raise NotImplementedError(
-            "Subclasses must override process_specials_content()!"
+            "Subclasses must override get_specials_list()!"
+        )
+
+    def process_element(self, special_dict):
+        raise NotImplementedError("Subclasses must override process_element()!")
+
+    def process_specials_list(self, specials_list):
+        for special in specials_list:
+            parsed_special = self.process_element(special)
+            if parsed_special is not None:
+                yield parsed_special
+
+    def process_specials_content(self, specials_content):
+        """
+        Yields the ParsedSpecial for each special in the content. Use
+        'collect_specials' to get them as a dictionary.
+        """
+        return self.process_specials_list(
+            self.get_specials_list(specials_content)
         )
 
 
+class ContentFingerprint:
+    """
+    Hashes specials as they are passed through 'iter' or 'spool', after
+    normalizing them (sorted keys and no whitespace), so the same specials
+    always have the same fingerprint. The result is the same as hashing the whole normalized list
+    at once, without ever needing the whole list.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256(b"[")
+        self._separator = b""
+
+    def update(self, special):
+        normalized = json.dumps(special, sort_keys=True, separators=(",", ":"))
+        self._hash.update(self._separator)
+        self._hash.update(normalized.encode())
+        self._separator = b","
+        return normalized
+
+    def spool(self, specials, file):
+        """
+        Hashes the specials and writes them to 'file' as they are normalized,
+        one per line, so they can be read back with 'json.loads'.
+        """
+        for special in specials:
+            file.write(self.update(special))
+            file.write("\n")
+
+    def iter(self, specials):
+        for special in specials:
+            self.update(special)
+            yield special
+
+    def hexdigest(self):
+        content_hash = self._hash.copy()
+        content_hash.update(b"]")
+        return content_hash.hexdigest()
+
+
+def collect_specials(parsed_specials):
+    """
+    Collects ParsedSpecials into a dictionary keyed by their special_id.
+    """
+    return {
+        parsed_special.special_id: parsed_special
+        for parsed_special in parsed_specials
+    }
+
+
 class ParsedSpecial(object):
     """
     A ParsedSpecial object represents the data that is on the Parser's
     website. The attributes of this object mirror that of the StoredSpecial
     object, however there are a few differences:
-        1) 'raw_string' - This is stored in the event of an error, so that the
+        1) 'raw_data' - The special as it was on the website, before it was
+                        parsed. This is kept so that 'raw_string' can be made
+                        from it.
+        2) 'raw_string' - This is used in the event of an error, so that the
                           original text from the website can be included in an
-                          error email. This is also stored so it can be used
-                          by the default function for the 'special_id_generator'.
-        2) 'errors' - Stores all the SpecialError objects that were created
+                          error email. It is also used to make a 'special_id'
+                          when one couldn't be parsed. Unless it is set
+                          directly, it is only made (from 'raw_data') the first
+                          time it is used, which for most specials is never.
+        3) 'errors' - Stores all the SpecialError objects that were created
                       during the parsing of the html. This is used in the error
                       email. This is also used to determine the value of the
                       'error' attribute.
+
+    There are a lot of these made every update, so the attributes are kept in
+    '__slots__' rather than a '__dict__' for each one. When a 'special_id'
+    has to be made from the raw data it is only hashed once, and kept after
+    that.
     """
 
-    def __init__(self, **kwargs):
-        self.reservation_id = kwargs.pop("reservation_id", None)
-        self.source = kwargs.pop("source", None)
-        self.source_name = kwargs.pop("source_name", None)
-        self.url = kwargs.pop("url", None)
-        self.type = kwargs.pop("type", None)
-        self.points = kwargs.pop("points", None)
-        self.price = kwargs.pop("price", None)
-        self.check_in = kwargs.pop("check_in", None)
-        self.check_out = kwargs.pop("check_out", None)
-        self.resort = kwargs.pop("resort", None)
-        self.room = kwargs.pop("room", None)
-        self.view = kwargs.pop("view", None)
-        self.raw_string = kwargs.pop("raw_string", None)
+    __slots__ = (
+        "reservation_id",
+        "source",
+        "source_name",
+        "url",
+        "type",
+        "points",
+        "price",
+        "check_in",
+        "check_out",
+        "resort",
+        "room",
+        "view",
+        "raw_data",
+        "errors",
+        "_raw_string",
+        "_special_id",
+        "_generated_special_id",
+    )
+
+    def __init__(
+        self,
+        *,
+        reservation_id=None,
+        source=None,
+        source_name=None,
+        url=None,
+        type=None,
+        points=None,
+        price=None,
+        check_in=None,
+        check_out=None,
+        resort=None,
+        room=None,
+        view=None,
+        raw_data=None,
+        raw_string=None,
+    ):
+        self.reservation_id = reservation_id
+        self.source = source
+        self.source_name = source_name
+        self.url = url
+        self.type = type
+        self.points = points
+        self.price = price
+        self.check_in = check_in
+        self.check_out = check_out
+        self.resort = resort
+        self.room = room
+        self.view = view
+        self.raw_data = raw_data
         self.errors = []
+        self._raw_string = raw_string
         self._special_id = None
+        self._generated_special_id = None
 
-        if len(kwargs) > 0:
-            raise TypeError(
-                f"__init__() got an unexpected keyword argument '{kwargs.popitem()[0]}'"
+    @property
+    def raw_string(self):
+        if self._raw_string is None and self.raw_data is not None:
+            self._raw_string = json.dumps(
+                self.raw_data, indent=" " * 4, sort_keys=True
             )
+        return self._raw_string
+
+    @raw_string.setter
+    def raw_string(self, value):
+        self._raw_string = value
 
     @property
     def special_id(self):
         if self._special_id is not None:
             return self._special_id
-        m = hashlib.sha256()
-        m.update(self.raw_string.encode())
-        return m.hexdigest()
+        if self._generated_special_id is None:
+            # The stored specials' ids are hashes of the 'raw_string', so it
+            # has to stay the same as it was when they were stored
+            m = hashlib.sha256()
+            m.update(self.raw_string.encode())
+            self._generated_special_id = m.hexdigest()
+        return self._generated_special_id
 
     @special_id.setter
     def special_id(self, value):
@@ -162,6 +459,10 @@ class ParsedSpecial(object):
     def error(self):
         return len(self.errors) > 0
 
+    @property
+    def fingerprint(self):
+        return special_fingerprint(self)
+
     def __repr__(self):
         return f"<Parsed Special: {self.special_id}>"
 
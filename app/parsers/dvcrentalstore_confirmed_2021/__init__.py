@@ -3,11 +3,12 @@ from datetime import datetime
 from functools import cached_property
 
 import tomlkit
-from flask import current_app, json
+from flask import current_app
 
 from ...errors import SpecialError
 from ...util import ProxyAttribute, SpecialTypes
 from ..base_parser import BaseParser, special_error
+from ..streaming import iter_json_array, iter_section
 
 
 class DVCRentalStoreConfirmed2021(BaseParser):
@@ -33,38 +34,35 @@ class DVCRentalStoreConfirmed2021(BaseParser):
             raise RuntimeError("Parser map was not loaded properly.")
         return data
 
+    def get_specials_content(self):
+        return self.stream_specials_page()
+
+    def get_local_specials_page(self, filename):
+        return self.stream_local_specials_page(filename)
+
     def get_specials_list(self, specials_content):
+        """
+        Finds the reservations in the content, which is either the whole page
+        or the page in chunks as it is being downloaded. Only the text of the
+        reservations list is kept, each reservation is decoded and yielded as
+        soon as all of its text has arrived. Once the end of the list is found
+        the rest of the page is not downloaded.
+        """
         script_identifier = '<script type="text/javascript" id="dvcrs-reservations-reactjs-js-before">'
         reservations_line_identifier = "var all_reservations = "
 
-        reservations_script_idx = specials_content.find(script_identifier)
-        if reservations_script_idx == -1:
-            raise RuntimeError("Could not find reservation script tag in html.")
+        if isinstance(specials_content, bytes):
+            specials_content = specials_content.decode()
+        if isinstance(specials_content, str):
+            specials_content = (specials_content,)
 
-        reservations_line_start_idx = specials_content.find(
-            reservations_line_identifier, reservations_script_idx
+        reservations_chunks = iter_section(
+            specials_content,
+            (script_identifier, reservations_line_identifier),
+            ";\n",
         )
-        if reservations_line_start_idx == -1:
-            raise RuntimeError(
-                "Could not find reservation line start index in html."
-            )
 
-        reservations_line_end_idx = specials_content.find(
-            ";\n", reservations_line_start_idx
-        )
-        if reservations_line_end_idx == -1:
-            raise RuntimeError(
-                "Could not find reservation line end index in html."
-            )
-
-        reservations_str = specials_content[
-            reservations_line_start_idx
-            + len(reservations_line_identifier) : reservations_line_end_idx
-        ]
-
-        specials = json.loads(reservations_str)
-
-        return specials
+        return iter_json_array(reservations_chunks)
 
     def process_element(self, special_dict):
         """
@@ -72,7 +70,7 @@ class DVCRentalStoreConfirmed2021(BaseParser):
         """
         parsed_special = self.new_parsed_special()
         parsed_special.type = SpecialTypes.PRECONFIRM
-        parsed_special.raw_string = json.dumps(special_dict, indent=" " * 4)
+        parsed_special.raw_data = special_dict
 
         for field, func in self.parse_fields.items():
             setattr(parsed_special, field, func(self, special_dict))
@@ -195,13 +193,3 @@ class DVCRentalStoreConfirmed2021(BaseParser):
         "room": get_room,
         "view": get_view,
     }
-
-    def process_specials_content(self, specials_content):
-        specials = self.get_specials_list(specials_content)
-        specials_dict = {}
-        for special in specials:
-            parsed_special = self.process_element(special)
-            if parsed_special is not None:
-                key = parsed_special.special_id
-                specials_dict[key] = parsed_special
-        return specials_dict
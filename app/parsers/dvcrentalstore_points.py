@@ -1,13 +1,12 @@
 from datetime import datetime
 
-from flask import json
-
 from ..errors import SpecialError
 from ..util import SpecialTypes
-from .base_parser import BaseParser, special_error
+from .base_parser import special_error
+from .knack_parser import KnackParser
 
 
-class DVCRentalPointParser(BaseParser):
+class DVCRentalPointParser(KnackParser):
     def __init__(self, *args):
         super(DVCRentalPointParser, self).__init__(
             source="dvcrentalstore_points",
@@ -36,7 +35,7 @@ class DVCRentalPointParser(BaseParser):
         """
         parsed_special = self.new_parsed_special()
         parsed_special.type = SpecialTypes.DISC_POINTS
-        parsed_special.raw_string = json.dumps(special_dict, indent=" " * 4)
+        parsed_special.raw_data = special_dict
 
         for field, func in self.parse_fields.items():
             setattr(parsed_special, field, func(self, special_dict))
@@ -104,15 +103,3 @@ class DVCRentalPointParser(BaseParser):
         "reservation_id": get_reservation_id,
         "special_id": get_special_id,
     }
-
-    def process_specials_content(self, specials_content):
-        specials = json.loads(specials_content).get("records", {})
-        specials_dict = {}
-
-        for special in specials:
-            parsed_special = self.process_element(special)
-            if parsed_special is not None:
-                key = parsed_special.special_id
-                specials_dict[key] = parsed_special
-
-        return specials_dict
@@ -1,16 +1,14 @@
-import random
-import time
 from datetime import datetime
 
-import requests
-from flask import current_app, json
+from flask import current_app
 
 from ..errors import SpecialError
 from ..util import SpecialTypes
-from .base_parser import BaseParser, special_error
+from .base_parser import special_error
+from .knack_parser import KnackParser
 
 
-class DVCRentalPreconfirmParser(BaseParser):
+class DVCRentalPreconfirmParser(KnackParser):
     def __init__(self, *args):
         super(DVCRentalPreconfirmParser, self).__init__(
             source="dvcrentalstore_preconfirms",
@@ -35,48 +33,13 @@ class DVCRentalPreconfirmParser(BaseParser):
             },
         )
 
-    def get_specials_page(self):
-        # Have to override the superclass because this has to support paging
-        # maybe eventually I can remove this, but for now there are too many preconfirms (> 1000)
-        content = []
-        total_pages = 1
-        retries = 0
-        print(f"Retrieving Specials from {self.source}")
-        while self.params["page"] <= total_pages:
-            while retries < 5:
-                if retries > 0:
-                    time.sleep(random.uniform(0, 2**retries))
-                    print(f"Attempting Retry on Specials Request: {retries}")
-                url = (
-                    self.data_url
-                    if self.data_url is not None
-                    else self.site_url
-                )
-                dvc_page = requests.get(
-                    url, headers=self.headers, params=self.params
-                )
-                if dvc_page.status_code in (500, 502, 503, 504):
-                    retries += 1
-                else:
-                    break
-            try:
-                dvc_json = dvc_page.json()
-            except ValueError as e:
-                print(f"Error when parsing '{self.source}' response:")
-                print(e)
-                return None
-            content.append(dvc_json)
-            total_pages = dvc_json.get("total_pages", 1)
-            self.params["page"] += 1
-        return content
-
     def process_element(self, special_dict):
         """
         Parses Preconfirmed specials. Info is parsed out of a JSON dictionary.
         """
         parsed_special = self.new_parsed_special()
         parsed_special.type = SpecialTypes.PRECONFIRM
-        parsed_special.raw_string = json.dumps(special_dict, indent=" " * 4)
+        parsed_special.raw_data = special_dict
 
         for field, func in self.parse_fields.items():
             setattr(parsed_special, field, func(self, special_dict))
@@ -173,16 +136,3 @@ class DVCRentalPreconfirmParser(BaseParser):
         "resort": get_resort,
         "room": get_room,
     }
-
-    def process_specials_content(self, specials_content_list):
-        specials_dict = {}
-        for specials_content in specials_content_list:
-            specials = specials_content.get("records", {})
-
-            for special in specials:
-                parsed_special = self.process_element(special)
-                if parsed_special is not None:
-                    key = parsed_special.special_id
-                    specials_dict[key] = parsed_special
-
-        return specials_dict
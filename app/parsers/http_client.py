@@ -0,0 +1,152 @@
+import atexit
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from flask import current_app
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class ParserHTTPClient:
+    """
+    The HTTP client that is shared by all of the parsers. It wraps a long
+    lived 'httpx.Client' so connections (HTTP/2 when the server supports it)
+    are kept alive and reused between requests, pages and parsers. Every
+    request has a connect and read timeout, so a server that stops responding
+    can't hang the whole update, and at most 'max_connections_per_host'
+    requests are made to the same host at the same time. A streamed response
+    counts towards that limit until it is closed, not just until its headers
+    arrive. Responses are only ever compressed with gzip or deflate, the
+    decoders httpx has without any extra packages.
+
+    In the event of a 500, 502, 503, or 504 response error, or if the
+    connection fails, the request is retried with backoff and jitter, at most
+    'retries' times. For more information about why that is implemented visit:
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+
+    retry_status_codes = (500, 502, 503, 504)
+
+    def __init__(
+        self,
+        connect_timeout=10,
+        read_timeout=30,
+        max_connections_per_host=4,
+        retries=4,
+    ):
+        self.client = httpx.Client(
+            http2=True,
+            follow_redirects=True,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self.max_connections_per_host = max_connections_per_host
+        self.retries = retries
+        self._host_semaphores = {}
+        self._host_semaphores_lock = threading.Lock()
+
+    def host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        with self._host_semaphores_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(
+                    max(1, self.max_connections_per_host)
+                )
+                self._host_semaphores[host] = semaphore
+        return semaphore
+
+    def get(self, url, headers=None, params=None, stream=False):
+        """
+        Sends a GET request. When 'stream' is True the body of the response is
+        not read, it is up to the caller to read it (i.e. with 'iter_text')
+        and close the response.
+        """
+        request = self.client.build_request(
+            "GET", url, headers=headers, params=params
+        )
+        retries = 0
+        while True:
+            if retries > 0:
+                time.sleep(random.uniform(0, 2**retries))
+                print(f"Attempting Retry on Specials Request: {retries}")
+            semaphore = self.host_semaphore(url)
+            semaphore.acquire()
+            try:
+                response = self.client.send(request, stream=stream)
+            except httpx.TransportError:
+                semaphore.release()
+                if retries >= self.retries:
+                    raise
+            except BaseException:
+                semaphore.release()
+                raise
+            else:
+                if stream and not response.is_closed:
+                    # The body is still being downloaded, so the host's slot
+                    # is held until the response is closed. A response that
+                    # httpx has already read and closed releases it now.
+                    response.stream = ReleasingStream(
+                        response.stream, semaphore.release
+                    )
+                else:
+                    semaphore.release()
+                if (
+                    response.status_code not in self.retry_status_codes
+                    or retries >= self.retries
+                ):
+                    return response
+                response.close()
+            retries += 1
+
+    def close(self):
+        self.client.close()
+
+
+class ReleasingStream(httpx.SyncByteStream):
+    """
+    Wraps the stream of a response, calling 'release' once when it is closed.
+    """
+
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+        self._released = False
+        self._release_lock = threading.Lock()
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            with self._release_lock:
+                released = self._released
+                self._released = True
+            if not released:
+                self.release()
+
+
+def get_parser_client():
+    """
+    Returns the ParserHTTPClient shared by all parsers, creating it from the
+    app's config the first time this is called.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            config = current_app.config
+            _client = ParserHTTPClient(
+                connect_timeout=config["PARSER_CONNECT_TIMEOUT"],
+                read_timeout=config["PARSER_READ_TIMEOUT"],
+                max_connections_per_host=config[
+                    "PARSER_MAX_CONNECTIONS_PER_HOST"
+                ],
+                retries=config["PARSER_RETRIES"],
+            )
+            atexit.register(_client.close)
+    return _client
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, json
+
+from .base_parser import BaseParser
+
+
+class KnackParser(BaseParser):
+    """
+    Base class for parsers that get their specials from a Knack 'records'
+    endpoint. The records are split into pages, so after the first page is
+    retrieved (which tells us how many pages there are) the rest of the pages
+    are all requested at once. At most 'KNACK_MAX_IN_FLIGHT' requests are made
+    at the same time. The pages are handed back in page order as they arrive,
+    so the processing of the first pages happens while the rest are still
+    being retrieved. Only the pages that have arrived but have not been
+    processed yet are held in memory.
+
+    Subclasses need to implement 'process_element', which is called with each
+    of the records.
+    """
+
+    def get_specials_page(self):
+        return list(self.get_specials_pages())
+
+    def get_specials_content(self):
+        return self.get_specials_pages()
+
+    def get_specials_pages(self):
+        print(f"Retrieving Specials from {self.source}")
+        first_page = self.get_records_page(1)
+        total_pages = first_page.get("total_pages", 1)
+        if total_pages <= 1:
+            yield first_page
+            return
+
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, current_app.config["KNACK_MAX_IN_FLIGHT"])
+        )
+        try:
+            futures = [
+                executor.submit(self.get_records_page, page)
+                for page in range(2, total_pages + 1)
+            ]
+            yield first_page
+            for future in futures:
+                yield future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def get_records_page(self, page):
+        dvc_page = self.get_response(self.params | {"page": page})
+        try:
+            return dvc_page.json()
+        except ValueError as e:
+            raise RuntimeError(
+                f"Error when parsing '{self.source}' response (page {page})."
+            ) from e
+
+    def get_local_specials_page(self, filename):
+        """
+        Loads the pages stored by 'store-specials-data'. A file with only a
+        single page (not in a list) works as well.
+        """
+        specials_content = json.loads(super().get_local_specials_page(filename))
+        if isinstance(specials_content, dict):
+            specials_content = [specials_content]
+        return specials_content
+
+    def get_specials_list(self, specials_pages):
+        for specials_page in specials_pages:
+            yield from specials_page.get("records", [])
@@ -0,0 +1,113 @@
+import json
+import re
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+_number_chars = frozenset("0123456789.eE+-")
+
+
+def iter_section(chunks, start_markers, end_marker):
+    """
+    Yields the text from 'chunks' (an iterable of str) that comes after all of
+    the 'start_markers', which must be found in order, and before the first
+    'end_marker' after them. Only the text that has not been searched yet is
+    held onto, so the content never needs to be in memory all at once. As soon
+    as the 'end_marker' is found, 'chunks' is closed (if it can be) so no more
+    of it is read.
+    """
+    chunks = iter(chunks)
+    try:
+        buffer = ""
+        for marker in start_markers:
+            buffer = yield from _find_marker(chunks, buffer, marker, False)
+        yield from _find_marker(chunks, buffer, end_marker, True)
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def _find_marker(chunks, buffer, marker, yield_text):
+    # Everything but the end of the buffer, which could be the start of a
+    # marker split between two chunks, can be handed off (or thrown away)
+    keep = len(marker) - 1
+    while True:
+        idx = buffer.find(marker)
+        if idx != -1:
+            if yield_text and idx > 0:
+                yield buffer[:idx]
+            return buffer[idx + len(marker) :]
+        if len(buffer) > keep:
+            if yield_text:
+                yield buffer[: len(buffer) - keep]
+            buffer = buffer[len(buffer) - keep :]
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise RuntimeError(f"Could not find '{marker.strip()}' in content.")
+        buffer += chunk
+
+
+def iter_json_array(chunks):
+    """
+    Decodes a JSON array from 'chunks' (an iterable of str) and yields its items
+    one at a time, as soon as all of the text for an item has been read. Only
+    the text of the item currently being decoded is held onto.
+    """
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    exhausted = False
+
+    def read_more():
+        nonlocal buffer, pos, exhausted
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def next_char():
+        nonlocal pos
+        while True:
+            pos = _whitespace.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                raise ValueError("Unexpected end of JSON array.")
+
+    if next_char() != "[":
+        raise ValueError("Content is not a JSON array.")
+    pos += 1
+    if next_char() == "]":
+        return
+    while True:
+        next_char()
+        while True:
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The item may not have been read completely yet
+                if exhausted or not read_more():
+                    raise
+                continue
+            # A number (or literal) that reaches the end of the buffer could
+            # continue in the next chunk
+            if (
+                end == len(buffer)
+                or (
+                    isinstance(item, (int, float))
+                    and buffer[end] in _number_chars
+                )
+            ) and (not exhausted and read_more()):
+                continue
+            break
+        pos = end
+        yield item
+        separator = next_char()
+        pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Unexpected '{separator}' in JSON array.")
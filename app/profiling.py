@@ -0,0 +1,116 @@
+import cProfile
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILERS = ("cprofile", "tracemalloc")
+
+
+class Profiler:
+    """
+    Profiles everything run inside of it ('with Profiler(...):') with either
+    cProfile or tracemalloc. When it is done the results are written to
+    'output_dir' (a '.pstats' file or a tracemalloc snapshot) and the 'top'
+    functions (or lines, for tracemalloc) are printed.
+
+    cProfile only profiles the thread it is started in, so code that runs in
+    other threads (like the parsers) needs to be wrapped in 'profile_thread'
+    to be included. tracemalloc already traces every thread.
+    """
+
+    def __init__(self, kind, output_dir, top=20, name="profile"):
+        if kind not in PROFILERS:
+            raise ValueError(f"Unknown profiler '{kind}'.")
+        self.kind = kind
+        self.output_dir = output_dir
+        self.top = top
+        self.name = name
+        self._profile = None
+        self._thread_profiles = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if self.kind == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            tracemalloc.start(25)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.kind == "cprofile":
+            self._profile.disable()
+            self.report_cprofile()
+        else:
+            self.report_tracemalloc()
+
+    @contextmanager
+    def profile_thread(self):
+        if self.kind != "cprofile":
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._thread_profiles.append(profile)
+
+    def get_output_path(self, extension):
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        return os.path.join(
+            self.output_dir, f"{self.name}-{timestamp}.{extension}"
+        )
+
+    def report_cprofile(self):
+        stats = pstats.Stats(self._profile)
+        for profile in self._thread_profiles:
+            stats.add(profile)
+        path = self.get_output_path("pstats")
+        stats.dump_stats(path)
+        print(f"Profile written to '{path}'")
+        print(f"Top {self.top} functions by time spent in them:")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+
+    def report_tracemalloc(self):
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        snapshot = snapshot.filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(
+                    False, "<frozen importlib._bootstrap_external>"
+                ),
+            )
+        )
+        path = self.get_output_path("tracemalloc")
+        snapshot.dump(path)
+        print(f"Allocation snapshot written to '{path}'")
+        print(
+            f"Memory still allocated: {current / 1024 / 1024:.1f} MiB, "
+            f"peak: {peak / 1024 / 1024:.1f} MiB"
+        )
+        print(f"Top {self.top} lines by memory still allocated:")
+        for statistic in snapshot.statistics("lineno")[: self.top]:
+            print(f"  {statistic}")
+
+
+@contextmanager
+def profile_thread(profiler):
+    """
+    Same as 'Profiler.profile_thread', but does nothing when 'profiler' is
+    None.
+    """
+    if profiler is None:
+        yield
+        return
+    with profiler.profile_thread():
+        yield
@@ -1,5 +1,7 @@
+import hashlib
+import json
 from collections import namedtuple
-from datetime import timedelta
+from datetime import date, timedelta
 from enum import Enum
 from itertools import groupby
 
@@ -7,6 +9,24 @@ from . import db
 
 ProxyAttribute = namedtuple("ProxyAttribute", ["id", "attr"])
 
+# These need to be the same as the keys from 'StoredSpecial.get_core_keys'.
+FINGERPRINT_KEYS = (
+    "special_id",
+    "reservation_id",
+    "source",
+    "source_name",
+    "url",
+    "type",
+    "points",
+    "price",
+    "check_in",
+    "check_out",
+    "error",
+    "resort",
+    "room",
+    "view",
+)
+
 
 class SpecialTypes(Enum):
     """
@@ -20,6 +40,16 @@ class SpecialTypes(Enum):
         return self.value
 
 
+class SpecialEventTypes(Enum):
+    """
+    Specifies the kinds of changes to a Special that are recorded.
+    """
+
+    ADDED = "added"
+    UPDATED = "updated"
+    REMOVED = "removed"
+
+
 class CharacteristicTypes(Enum):
     """
     Specifies the different kinds of Characteristic types
@@ -42,6 +72,33 @@ class ContactTypes(Enum):
     APN = "apn"
 
 
+def special_fingerprint(special):
+    """
+    Hashes the core attributes of a special, either a StoredSpecial or a
+    ParsedSpecial. Characteristics are hashed by their id, whether they are a
+    ProxyAttribute or the Characteristic itself, so two specials that are
+    equal will always have the same fingerprint.
+    """
+    values = [plain_value(getattr(special, key)) for key in FINGERPRINT_KEYS]
+    return hashlib.sha256(
+        json.dumps(values, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def plain_value(value):
+    """
+    Converts a value of a special to one that can be stored as JSON, with
+    Characteristics (and ProxyAttributes) converted to their id.
+    """
+    if isinstance(value, ProxyAttribute):
+        return value.id
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, date):
+        return value.isoformat()
+    return getattr(value, "characteristic_id", value)
+
+
 class InheritedModelLoader:
     model = None
     order_by = None
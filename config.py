@@ -16,6 +16,14 @@ class Config:
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace(
             "postgres://", "postgresql://", 1
         )
+    # The benchmarks drop every table, they only run when DATABASE_URL is the
+    # same as this
+    BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+    if BENCH_DATABASE_URL and BENCH_DATABASE_URL.startswith("postgres://"):
+        BENCH_DATABASE_URL = BENCH_DATABASE_URL.replace(
+            "postgres://", "postgresql://", 1
+        )
+    BENCHMARKS = os.getenv("BENCHMARKS", "False") == "True"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     MAILGUN_API_KEY = os.getenv("MAILGUN_API_KEY")
     MAILGUN_DOMAIN_NAME = os.getenv("MAILGUN_DOMAIN_NAME")
@@ -26,6 +34,14 @@ class Config:
     DVCRENTALSTORE_PRECONFIRM_RPP = int(
         os.getenv("DVCRENTALSTORE_PRECONFIRM_RPP", 100)
     )
+    PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", 4))
+    KNACK_MAX_IN_FLIGHT = int(os.getenv("KNACK_MAX_IN_FLIGHT", 4))
+    PARSER_CONNECT_TIMEOUT = float(os.getenv("PARSER_CONNECT_TIMEOUT", 10))
+    PARSER_READ_TIMEOUT = float(os.getenv("PARSER_READ_TIMEOUT", 30))
+    PARSER_MAX_CONNECTIONS_PER_HOST = int(
+        os.getenv("PARSER_MAX_CONNECTIONS_PER_HOST", 4)
+    )
+    PARSER_RETRIES = int(os.getenv("PARSER_RETRIES", 4))
     APNS_KEY_ID = os.getenv("APNS_KEY_ID")
     APNS_TEAM_ID = os.getenv("APNS_TEAM_ID")
     APNS_AUTH_KEY = os.getenv("APNS_AUTH_KEY")
@@ -33,6 +49,11 @@ class Config:
     SEND_EMAIL_ON_DEPLOY = os.getenv("SEND_EMAIL_ON_DEPLOY", "False") == "True"
     STRICT_SECURITY = False
     TZ = os.getenv("TZ", "America/New_York")
+    SQL_INSTRUMENTATION = os.getenv("SQL_INSTRUMENTATION", "False") == "True"
+    SQL_SLOWEST_QUERIES = int(os.getenv("SQL_SLOWEST_QUERIES", 5))
+    SQL_QUERY_WARNING_THRESHOLD = int(
+        os.getenv("SQL_QUERY_WARNING_THRESHOLD", 50)
+    )
 
     @staticmethod
     def init_app(app):
@@ -56,6 +77,14 @@ class StagingConfig:
 class DevelopmentConfig(Config):
     ENV_LABEL = "dev"
     SQLALCHEMY_ECHO = os.getenv("SQLALCHEMY_ECHO", "True") == "True"
+    BENCHMARKS = os.getenv("BENCHMARKS", "True") == "True"
+
+
+class TestingConfig(Config):
+    ENV_LABEL = "test"
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv("TEST_DATABASE_URL", "sqlite://")
+    BENCHMARKS = True
 
 
 class ProductionConfig(Config):
@@ -92,6 +121,7 @@ class CapRoverStagingConfig(StagingConfig, CapRoverConfig):
 
 config = {
     "development": DevelopmentConfig,
+    "testing": TestingConfig,
     "heroku": HerokuConfig,
     "heroku_staging": HerokuStagingConfig,
     "caprover": CapRoverConfig,
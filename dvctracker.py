@@ -5,6 +5,7 @@ from flask_migrate import Migrate, upgrade
 from app import create_app, db
 from app.cli import update_specials
 from app.criteria import ImportantCriteria
+from app.matches import rebuild_matches
 from app.models import (
     Category,
     CategoryModelLoader,
@@ -72,7 +73,15 @@ def deploy():
     Room.insert_data_from(app.config["STATIC_DATA_PATH"])
     View.insert_data_from(app.config["STATIC_DATA_PATH"])
 
+    # the matches are kept up to date by each update, they are made from
+    # scratch here so a new (or empty) matches table and any change to how
+    # criteria are checked are picked up before the update compares against
+    # them
+    print("Rebuilding the specials that are important to each user...")
+    rebuild_matches(db.session.scalars(db.select(User)).all())
+    db.session.commit()
+
     # run an update to the specials, if the db changed we may now track more
     # data and need to update to get it
     print("Upgrading stored specials with live data...")
-    update_specials((), app.config["SEND_EMAIL_ON_DEPLOY"], False)
+    update_specials((), app.config["SEND_EMAIL_ON_DEPLOY"], False, force=True)
@@ -0,0 +1,140 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+# config.py reads the environment when it is imported
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("FLASK_CONFIG", "testing")
+
+from app import create_app, db  # noqa: E402
+from app.models import (  # noqa: E402
+    Resort,
+    ResortCategory,
+    Room,
+    RoomCategory,
+    StoredSpecial,
+    User,
+    View,
+    ViewCategory,
+)
+from app.util import SpecialTypes  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmarks",
+        action="store_true",
+        help="Run the benchmarks (the tests marked 'bench').",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="Only runs with --benchmarks")
+    for item in items:
+        if "bench" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def app():
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+        for Model in (
+            ResortCategory,
+            RoomCategory,
+            ViewCategory,
+            Resort,
+            Room,
+            View,
+        ):
+            Model.insert_data_from(app.config["STATIC_DATA_PATH"])
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def specials(app):
+    """
+    A few preconfirmed reservations and discounted points, stored in the
+    database.
+    """
+    first_check_in = date(2027, 1, 1)
+    specials = [
+        StoredSpecial(
+            special_id=f"preconfirm{i}",
+            type=SpecialTypes.PRECONFIRM,
+            points=100 + i * 20,
+            price=1000 + i * 400,
+            check_in=first_check_in + timedelta(days=i * 10),
+            check_out=first_check_in + timedelta(days=i * 10 + 2 + i % 5),
+            resort_id=resort_id,
+            room_id=room_id,
+        )
+        for i, (resort_id, room_id) in enumerate(
+            zip(
+                [
+                    "resort_blt",
+                    "resort_vgf",
+                    "resort_kidani",
+                    "resort_boardwalk",
+                ]
+                * 3,
+                ["room_studio", "room_one", "room_two"] * 4,
+            )
+        )
+    ] + [
+        StoredSpecial(
+            special_id=f"disc_points{i}",
+            type=SpecialTypes.DISC_POINTS,
+            points=50 + i * 50,
+            price=14 + i,
+            check_out=first_check_in + timedelta(days=i * 30),
+        )
+        for i in range(4)
+    ]
+    db.session.add_all(specials)
+    db.session.commit()
+    return specials
+
+
+@pytest.fixture
+def users(app):
+    """
+    Users with criteria that match some of the 'specials'.
+    """
+    users = [
+        User(
+            username="preconfirm",
+            password_hash="test",
+            important_criteria={
+                "important_only": False,
+                "preconfirm": [
+                    {"price": 3000, "resorts": ["resort_blt", "resort_vgf"]},
+                    {
+                        "date": {
+                            "start": date(2027, 2, 1),
+                            "end": date(2027, 3, 1),
+                        },
+                        "length_of_stay": 4,
+                    },
+                ],
+            },
+        ),
+        User(
+            username="disc_points",
+            password_hash="test",
+            important_criteria={
+                "important_only": True,
+                "disc_points": [{"points": 100, "price_per_point": 16}],
+            },
+        ),
+        User(username="no_criteria", password_hash="test"),
+    ]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
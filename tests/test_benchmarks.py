@@ -0,0 +1,136 @@
+"""
+Benchmarks of the parsers and the criteria matching over synthetic payloads,
+the same ones the 'bench-*' commands use. They need pytest-benchmark and
+only run with '--benchmarks', i.e.:
+
+    python -m pytest --benchmarks tests/test_benchmarks.py
+"""
+
+import random
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from app.benchmarks.synthetic import (  # noqa: E402
+    characteristic_ids,
+    confirmed_reservations,
+    confirmed_reservations_page,
+    important_criteria,
+    knack_pages,
+    knack_points_records,
+    knack_preconfirm_records,
+    stored_specials,
+)
+from app.criteria import CriteriaIndex, ImportantCriteria  # noqa: E402
+from app.parsers import (  # noqa: E402
+    DVCRentalPointParser,
+    DVCRentalPreconfirmParser,
+    DVCRentalStoreConfirmed2021,
+)
+from app.parsers.base_parser import collect_specials  # noqa: E402
+from app.util import SpecialTypes  # noqa: E402
+
+pytestmark = pytest.mark.bench
+
+COUNT = 2000
+
+
+def confirmed_payload():
+    return confirmed_reservations_page(confirmed_reservations(COUNT))
+
+
+def points_payload():
+    return knack_pages(knack_points_records(COUNT))
+
+
+def preconfirm_payload():
+    return knack_pages(knack_preconfirm_records(COUNT))
+
+
+PARSERS = [
+    (DVCRentalStoreConfirmed2021, confirmed_payload),
+    (DVCRentalPointParser, points_payload),
+    (DVCRentalPreconfirmParser, preconfirm_payload),
+]
+PARSER_IDS = [Parser.__name__ for Parser, _ in PARSERS]
+
+
+@pytest.mark.parametrize("Parser, payload", PARSERS, ids=PARSER_IDS)
+def test_parse(app, benchmark, Parser, payload):
+    dvc_parser = Parser()
+    content = payload()
+    specials = benchmark(
+        lambda: collect_specials(dvc_parser.process_specials_content(content))
+    )
+    benchmark.extra_info["records"] = COUNT
+    assert len(specials) == COUNT
+
+
+@pytest.mark.parametrize("Parser, payload", PARSERS, ids=PARSER_IDS)
+def test_extract(app, benchmark, Parser, payload):
+    dvc_parser = Parser()
+    content = payload()
+    records = benchmark(lambda: list(dvc_parser.get_specials_list(content)))
+    assert len(records) == COUNT
+
+
+@pytest.mark.parametrize(
+    "Parser, payload, field",
+    [
+        (Parser, payload, field)
+        for Parser, payload in PARSERS
+        for field in Parser.parse_fields
+    ],
+    ids=[
+        f"{Parser.__name__}-{field}"
+        for Parser, _ in PARSERS
+        for field in Parser.parse_fields
+    ],
+)
+def test_parse_field(app, benchmark, Parser, payload, field):
+    dvc_parser = Parser()
+    records = list(dvc_parser.get_specials_list(payload()))
+    func = Parser.parse_fields[field]
+
+    def parse_field():
+        for record in records:
+            func(dvc_parser, record)
+            dvc_parser.current_error = None
+
+    benchmark(parse_field)
+
+
+@pytest.fixture
+def criteria_and_specials(app):
+    ids = characteristic_ids(app.config["STATIC_DATA_PATH"])
+    rng = random.Random(0)
+    all_criteria = []
+    for _ in range(40):
+        criteria = important_criteria(rng, *ids)
+        all_criteria.append(
+            ImportantCriteria(
+                {
+                    SpecialTypes(key) if key != "important_only" else key: value
+                    for key, value in criteria.items()
+                }
+            )
+        )
+    return all_criteria, stored_specials(COUNT, *ids)
+
+
+def test_match_compiled(benchmark, criteria_and_specials):
+    all_criteria, specials = criteria_and_specials
+    benchmark(
+        lambda: [
+            [criteria.is_important_special(special) for special in specials]
+            for criteria in all_criteria
+        ]
+    )
+
+
+def test_match_index(benchmark, criteria_and_specials):
+    all_criteria, specials = criteria_and_specials
+    benchmark(
+        lambda: CriteriaIndex(dict(enumerate(all_criteria))).match_all(specials)
+    )
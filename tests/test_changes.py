@@ -0,0 +1,129 @@
+from datetime import date
+
+import pytest
+
+from app import db
+from app.changes import diff_specials, query_stored_specials
+from app.errors import SpecialError
+from app.models import StoredSpecial
+from app.parsers import ParsedSpecial
+from app.util import ProxyAttribute, SpecialTypes
+
+SOURCE = "test"
+
+
+def parsed_special(special_id, price=1000, error=False, **values):
+    special = ParsedSpecial(
+        source=SOURCE,
+        source_name="Test",
+        type=SpecialTypes.PRECONFIRM,
+        points=100,
+        price=price,
+        check_in=date(2027, 1, 1),
+        check_out=date(2027, 1, 5),
+        resort=ProxyAttribute("resort_blt", "resort"),
+        **values,
+    )
+    special.special_id = special_id
+    if error:
+        special.errors.append(SpecialError("price"))
+    return special
+
+
+def store(*parsed_specials):
+    StoredSpecial.bulk_insert(
+        StoredSpecial.from_parsed_special(special)
+        for special in parsed_specials
+    )
+    db.session.commit()
+
+
+def diff(*parsed_specials):
+    return diff_specials(
+        {special.special_id: special for special in parsed_specials},
+        query_stored_specials(SOURCE),
+    )
+
+
+def special_ids(specials):
+    return [special.special_id for special in specials]
+
+
+def test_buckets(app):
+    store(
+        parsed_special("same"),
+        parsed_special("changed", price=1000),
+        parsed_special("removed"),
+        parsed_special("error", error=True),
+    )
+    changes = diff(
+        parsed_special("same"),
+        parsed_special("changed", price=1200),
+        parsed_special("error", error=True),
+        parsed_special("added"),
+    )
+    assert list(changes.added) == ["added"]
+    assert [
+        (parsed.special_id, stored.special_id)
+        for parsed, stored in changes.updated
+    ] == [("changed", "changed")]
+    assert special_ids(changes.removed) == ["removed"]
+    assert special_ids(changes.errors) == ["error"]
+
+
+def test_same_fingerprint_is_not_loaded(app, monkeypatch):
+    store(parsed_special("same"))
+    loaded = []
+    monkeypatch.setattr(
+        "app.changes.load_stored_specials",
+        lambda special_ids: loaded.extend(special_ids) or {},
+    )
+    changes = diff(parsed_special("same"))
+    assert not changes.added
+    assert not changes.updated
+    assert not changes.removed
+    assert not changes.errors
+    assert loaded == []
+
+
+def test_stale_fingerprint_with_equal_fields_is_refreshed(app):
+    store(parsed_special("stale"))
+    db.session.execute(
+        db.update(StoredSpecial)
+        .where(StoredSpecial.special_id == "stale")
+        .values(fingerprint=None)
+    )
+    changes = diff(parsed_special("stale"))
+    assert not changes.updated
+    db.session.commit()
+    assert (
+        db.session.get(StoredSpecial, "stale").fingerprint
+        == parsed_special("stale").fingerprint
+    )
+
+
+def test_mixed_case_ids(app):
+    stored_ids = ["B2", "a1", "b3", "Z9", "_0"]
+    store(*(parsed_special(special_id) for special_id in stored_ids))
+    assert special_ids(query_stored_specials(SOURCE)) == sorted(stored_ids)
+
+    changes = diff(
+        *(
+            parsed_special(special_id)
+            for special_id in ["a1", "A1", "b3", "Z9", "z9", "_0"]
+        )
+    )
+    assert sorted(changes.added) == ["A1", "z9"]
+    assert special_ids(changes.removed) == ["B2"]
+    assert not changes.updated
+
+
+def test_unordered_stored_rows_raise(app):
+    class Row:
+        def __init__(self, special_id):
+            self.special_id = special_id
+            self.fingerprint = None
+            self.error = False
+
+    with pytest.raises(RuntimeError):
+        diff_specials({}, [Row("b"), Row("a")])
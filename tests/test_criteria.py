@@ -0,0 +1,170 @@
+from datetime import date
+
+import pytest
+
+from app import db
+from app.criteria import CriteriaIndex, ImportantCriteria, SpecialColumns
+from app.models import StoredSpecial
+from app.util import SpecialTypes
+
+CRITERIA = [
+    {
+        SpecialTypes.PRECONFIRM: [
+            {"date": {"start": date(2027, 1, 1), "end": date(2027, 2, 1)}}
+        ]
+    },
+    # Inverted dates never match
+    {
+        SpecialTypes.PRECONFIRM: [
+            {"date": {"start": date(2027, 2, 1), "end": date(2027, 1, 1)}}
+        ]
+    },
+    {SpecialTypes.PRECONFIRM: [{"date": {"end": date(2027, 2, 1)}}]},
+    {SpecialTypes.DISC_POINTS: [{"date": {"end": date(2027, 1, 15)}}]},
+    {SpecialTypes.PRECONFIRM: [{"length_of_stay": 3}]},
+    {SpecialTypes.PRECONFIRM: [{"length_of_stay": 0}]},
+    {SpecialTypes.PRECONFIRM: [{"price": 2000}]},
+    {SpecialTypes.PRECONFIRM: [{"price": 0}]},
+    {SpecialTypes.PRECONFIRM: [{"price_per_night": 500}]},
+    {SpecialTypes.PRECONFIRM: [{"price_per_night": 0}]},
+    {SpecialTypes.PRECONFIRM: [{"price_per_point": 15}]},
+    {SpecialTypes.DISC_POINTS: [{"price_per_point": 15}]},
+    {SpecialTypes.DISC_POINTS: [{"points": 100}]},
+    {SpecialTypes.DISC_POINTS: [{"points": 0}]},
+    {SpecialTypes.PRECONFIRM: [{"resorts": ["resort_blt", "resort_vgf"]}]},
+    {
+        SpecialTypes.PRECONFIRM: [
+            {"rooms": ["room_studio"], "views": ["view_lake"]}
+        ]
+    },
+    {SpecialTypes.PRECONFIRM: [{"resorts": []}]},
+    {SpecialTypes.PRECONFIRM: [{}]},
+    {
+        SpecialTypes.PRECONFIRM: [
+            {"price": 2000, "resorts": ["resort_blt"]},
+            {"date": {"start": date(2027, 1, 10), "end": date(2027, 1, 20)}},
+        ],
+        SpecialTypes.DISC_POINTS: [{"points": 50, "price_per_point": 16}],
+    },
+    {},
+]
+
+
+def make_special(special_id, special_type, **values):
+    values = {
+        "points": 100,
+        "price": 1500,
+        "check_in": date(2027, 1, 10),
+        "check_out": date(2027, 1, 14),
+        "resort_id": "resort_blt",
+        "room_id": "room_studio",
+        "view_id": "view_lake",
+    } | values
+    return StoredSpecial(special_id=special_id, type=special_type, **values)
+
+
+@pytest.fixture
+def edge_specials(app):
+    """
+    Specials with values that are missing, zero or out of order, loaded back
+    from the database so their resort, room and view are set.
+    """
+    db.session.add_all(
+        [
+            make_special("preconfirm", SpecialTypes.PRECONFIRM),
+            make_special(
+                "disc_points", SpecialTypes.DISC_POINTS, check_in=None
+            ),
+            make_special(
+                "other_resort", SpecialTypes.PRECONFIRM, resort_id="resort_vgf"
+            ),
+            make_special("no_view", SpecialTypes.PRECONFIRM, view_id=None),
+            make_special("no_price", SpecialTypes.PRECONFIRM, price=None),
+            make_special("no_points", SpecialTypes.PRECONFIRM, points=None),
+            make_special("no_check_in", SpecialTypes.PRECONFIRM, check_in=None),
+            make_special(
+                "no_check_out", SpecialTypes.PRECONFIRM, check_out=None
+            ),
+            make_special("zero_price", SpecialTypes.PRECONFIRM, price=0),
+            make_special("zero_points", SpecialTypes.PRECONFIRM, points=0),
+            make_special(
+                "zero_nights",
+                SpecialTypes.PRECONFIRM,
+                check_out=date(2027, 1, 10),
+            ),
+            make_special(
+                "inverted_dates",
+                SpecialTypes.PRECONFIRM,
+                check_out=date(2027, 1, 5),
+            ),
+            make_special(
+                "zero_disc_points", SpecialTypes.DISC_POINTS, points=0
+            ),
+            make_special("no_disc_price", SpecialTypes.DISC_POINTS, price=None),
+        ]
+    )
+    db.session.commit()
+    return db.session.scalars(db.select(StoredSpecial)).all()
+
+
+def scalar_matches(criteria, specials):
+    important_criteria = ImportantCriteria(criteria)
+    return {
+        special.special_id
+        for special in specials
+        if important_criteria.check_special(special)
+    }
+
+
+@pytest.mark.parametrize("criteria", CRITERIA)
+def test_compiled_criteria(edge_specials, criteria):
+    important_criteria = ImportantCriteria(criteria)
+    assert {
+        special.special_id
+        for special in edge_specials
+        if important_criteria.is_important_special(special)
+    } == scalar_matches(criteria, edge_specials)
+
+
+def test_criteria_index(edge_specials):
+    criteria_index = CriteriaIndex(
+        {i: ImportantCriteria(criteria) for i, criteria in enumerate(CRITERIA)}
+    )
+    matches = criteria_index.match_all(edge_specials)
+    for i, criteria in enumerate(CRITERIA):
+        assert {
+            special.special_id for special in matches.get(i, ())
+        } == scalar_matches(criteria, edge_specials), criteria
+
+
+@pytest.mark.parametrize("criteria", CRITERIA)
+def test_where_clause(edge_specials, criteria):
+    where_clause = ImportantCriteria(criteria).where_clause()
+    assert set(
+        db.session.scalars(
+            db.select(StoredSpecial.special_id).where(where_clause)
+        )
+    ) == scalar_matches(criteria, edge_specials)
+
+
+def test_special_columns(edge_specials):
+    columns = SpecialColumns(edge_specials)
+    important_masks = columns.important_masks(
+        {i: ImportantCriteria(criteria) for i, criteria in enumerate(CRITERIA)}
+    )
+    for i, criteria in enumerate(CRITERIA):
+        assert {
+            special.special_id
+            for special, important in zip(
+                edge_specials, columns.flags(important_masks[i])
+            )
+            if important
+        } == scalar_matches(criteria, edge_specials), criteria
+
+
+def test_special_columns_without_specials():
+    columns = SpecialColumns([])
+    assert (
+        columns.flags(ImportantCriteria(CRITERIA[0]).important_mask(columns))
+        == []
+    )
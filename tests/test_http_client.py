@@ -0,0 +1,101 @@
+import httpx
+
+from app.parsers.http_client import ParserHTTPClient
+
+URL = "https://example.invalid/specials"
+
+
+def make_client(handler, **kwargs):
+    client = ParserHTTPClient(max_connections_per_host=1, **kwargs)
+    client.client = httpx.Client(transport=httpx.MockTransport(handler))
+    return client
+
+
+def slot_is_free(client):
+    semaphore = client.host_semaphore(URL)
+    if not semaphore.acquire(blocking=False):
+        return False
+    semaphore.release()
+    return True
+
+
+def streamed_response(request):
+    # Content from an iterator isn't read by httpx before it is returned
+    return httpx.Response(200, content=iter([b"spec", b"ials"]))
+
+
+def test_streamed_response_holds_host_slot_until_closed():
+    client = make_client(streamed_response)
+    response = client.get(URL, stream=True)
+    assert not slot_is_free(client)
+    assert "".join(response.iter_text()) == "specials"
+    response.close()
+    assert slot_is_free(client)
+    # Closing it again doesn't release the slot twice
+    response.close()
+    assert slot_is_free(client)
+
+
+def test_read_streamed_response_releases_host_slot():
+    client = make_client(lambda request: httpx.Response(200, text="specials"))
+    response = client.get(URL, stream=True)
+    assert response.text == "specials"
+    assert slot_is_free(client)
+
+
+def test_response_releases_host_slot():
+    client = make_client(lambda request: httpx.Response(200, text="specials"))
+    assert client.get(URL).text == "specials"
+    assert slot_is_free(client)
+
+
+def test_retried_stream_releases_host_slot(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+    statuses = iter([503, 200])
+    client = make_client(
+        lambda request: httpx.Response(
+            next(statuses), content=iter([b"specials"])
+        ),
+        retries=1,
+    )
+    response = client.get(URL, stream=True)
+    assert response.status_code == 200
+    response.close()
+    assert slot_is_free(client)
+
+
+def test_transport_error_releases_host_slot(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    client = make_client(handler, retries=1)
+    try:
+        client.get(URL)
+    except httpx.ConnectError:
+        pass
+    else:
+        raise AssertionError("ConnectError was not raised")
+    assert slot_is_free(client)
+
+
+def test_read_error_releases_host_slot():
+    def broken_body():
+        yield b"spec"
+        raise httpx.ReadError("connection reset")
+
+    client = make_client(
+        lambda request: httpx.Response(200, content=broken_body())
+    )
+    response = client.get(URL, stream=True)
+    try:
+        for _ in response.iter_bytes():
+            pass
+    except httpx.ReadError:
+        pass
+    else:
+        raise AssertionError("ReadError was not raised")
+    finally:
+        response.close()
+    assert slot_is_free(client)
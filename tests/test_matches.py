@@ -0,0 +1,62 @@
+import dvctracker
+from app import db
+from app.criteria import ImportantCriteria
+from app.matches import rebuild_matches
+from app.models import StoredSpecial, User, UserSpecialMatch
+
+
+def stored_matches():
+    return set(
+        db.session.execute(
+            db.select(UserSpecialMatch.user_id, UserSpecialMatch.special_id)
+        )
+    )
+
+
+def checked_matches(users, specials):
+    """
+    The matches found by checking every special against every user's criteria
+    one at a time.
+    """
+    return {
+        (user.user_id, special.special_id)
+        for user in users
+        for special in specials
+        if ImportantCriteria(user.important_criteria).check_special(special)
+    }
+
+
+def test_rebuild_matches(users, specials):
+    rebuild_matches(users)
+    db.session.commit()
+
+    matches = stored_matches()
+    assert matches
+    assert matches == checked_matches(
+        db.session.scalars(db.select(User)).all(),
+        db.session.scalars(db.select(StoredSpecial)).all(),
+    )
+
+
+def test_deploy_fills_empty_matches(app, users, specials, monkeypatch):
+    # Right after the migration there are specials and users, but no matches
+    assert not stored_matches()
+
+    matches_at_update = []
+    # The schema is already made with 'create_all' and updating the specials
+    # needs the live sites, so only the matches are left to deploy
+    monkeypatch.setattr(dvctracker, "upgrade", lambda: None)
+    monkeypatch.setattr(
+        dvctracker,
+        "update_specials",
+        lambda *args, **kwargs: matches_at_update.append(stored_matches()),
+    )
+    result = app.test_cli_runner().invoke(dvctracker.deploy)
+    assert result.exit_code == 0, result.output
+
+    expected = checked_matches(
+        db.session.scalars(db.select(User)).all(),
+        db.session.scalars(db.select(StoredSpecial)).all(),
+    )
+    assert expected
+    assert matches_at_update == [expected]
@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+from datetime import date
+
+from app import db
+from app.models import StoredSpecial
+from app.util import ProxyAttribute, SpecialTypes, special_fingerprint
+
+RESORT = ProxyAttribute("resort_blt", "resort")
+
+
+def test_characteristics_are_not_kept_after_session_remove(app):
+    resort = StoredSpecial.convert_proxy(RESORT)
+    name = resort.name
+    db.session.commit()
+    db.session.remove()
+
+    converted = StoredSpecial.convert_proxy(RESORT)
+    assert converted is not resort
+    assert converted in db.session
+    assert converted.name == name
+
+
+def test_characteristics_are_not_kept_after_rollback(app):
+    resort = StoredSpecial.convert_proxy(RESORT)
+    db.session.rollback()
+    assert "characteristics" not in db.session.info
+
+    converted = StoredSpecial.convert_proxy(RESORT)
+    assert converted in db.session
+    assert converted.characteristic_id == resort.characteristic_id
+
+
+def stored_special(special_id, **values):
+    values = {
+        "source": "test",
+        "type": SpecialTypes.PRECONFIRM,
+        "price": 1000,
+        "points": 100,
+        "check_in": date(2027, 1, 1),
+        "check_out": date(2027, 1, 5),
+    } | values
+    return StoredSpecial(special_id=special_id, **values)
+
+
+@contextmanager
+def count_statements(prefix):
+    statements = []
+
+    def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if statement.startswith(prefix):
+            statements.append(statement)
+
+    engine = db.engine
+    db.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        db.event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_bulk_update(app):
+    blt = StoredSpecial.convert_proxy(RESORT)
+    vgf = StoredSpecial.convert_proxy(ProxyAttribute("resort_vgf", "resort"))
+    new_specials = [stored_special(special_id) for special_id in "123"]
+    for special in new_specials:
+        special.set_core_value("resort", blt)
+    StoredSpecial.bulk_insert(new_specials)
+    db.session.commit()
+
+    specials = db.session.scalars(
+        db.select(StoredSpecial).where(StoredSpecial.special_id.in_(["1", "2"]))
+    ).all()
+    for special in specials:
+        other = stored_special(special.special_id, price=2000)
+        other.set_core_value("resort", vgf)
+        special.update_with_special(other)
+    with count_statements("UPDATE stored_specials") as statements:
+        StoredSpecial.bulk_update(specials)
+    # SQLite has no ON CONFLICT DO UPDATE path, it is one executemany UPDATE
+    assert len(statements) == 1
+    assert all(special not in db.session for special in specials)
+    db.session.commit()
+    db.session.remove()
+
+    updated = db.session.scalars(
+        db.select(StoredSpecial).order_by(StoredSpecial.special_id)
+    ).all()
+    assert [
+        (special.special_id, special.price, special.resort_id)
+        for special in updated
+    ] == [
+        ("1", 2000, "resort_vgf"),
+        ("2", 2000, "resort_vgf"),
+        ("3", 1000, "resort_blt"),
+    ]
+    for special in updated[:2]:
+        assert special.fingerprint == special_fingerprint(special)
+
+
+def test_bulk_delete_in_batches(app):
+    specials = [stored_special(f"{i:04d}") for i in range(1201)]
+    StoredSpecial.bulk_insert(specials)
+    db.session.commit()
+
+    removed = db.session.scalars(
+        db.select(StoredSpecial).where(StoredSpecial.special_id < "1001")
+    ).all()
+    assert len(removed) == 1001
+    with count_statements("DELETE FROM stored_specials") as statements:
+        StoredSpecial.bulk_delete(removed)
+    assert len(statements) == 3
+    db.session.commit()
+
+    assert db.session.scalars(
+        db.select(StoredSpecial.special_id).order_by(StoredSpecial.special_id)
+    ).all() == [f"{i:04d}" for i in range(1001, 1201)]
+    # The deleted specials can still be used afterwards
+    assert removed[0].special_id == "0000"
+    assert removed[-1].price == 1000
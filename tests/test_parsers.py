@@ -0,0 +1,169 @@
+import json
+
+import pytest
+
+from app.parsers.base_parser import BaseParser
+from app.parsers.streaming import iter_json_array, iter_section
+
+
+class RecordsParser(BaseParser):
+    """
+    A parser for a list of records, that counts how many it parsed.
+    """
+
+    def __init__(self, records):
+        super().__init__("test", "Test", "https://example.invalid")
+        self.records = records
+        self.processed = 0
+
+    def get_specials_content(self):
+        return self.records
+
+    def get_specials_list(self, specials_content):
+        yield from specials_content
+
+    def process_element(self, special_dict):
+        self.processed += 1
+        parsed_special = self.new_parsed_special()
+        parsed_special.raw_data = special_dict
+        parsed_special.special_id = special_dict["id"]
+        parsed_special.price = special_dict["price"]
+        return parsed_special
+
+
+RECORDS = [{"id": "1", "price": 1000}, {"id": "2", "price": 2000}]
+
+
+def test_first_run_parses_and_fingerprints(app):
+    parser = RecordsParser(RECORDS)
+    specials = parser.get_all_specials()
+    assert set(specials) == {"1", "2"}
+    assert parser.processed == 2
+    assert parser.content_fingerprint is not None
+
+
+def test_same_records_are_not_parsed(app):
+    first = RecordsParser(RECORDS)
+    first.get_all_specials()
+
+    # The order of the keys doesn't change the fingerprint
+    parser = RecordsParser(
+        [dict(reversed(record.items())) for record in RECORDS]
+    )
+    parser.previous_fingerprint = first.content_fingerprint
+    assert parser.get_all_specials() is None
+    assert parser.processed == 0
+    assert parser.content_fingerprint == first.content_fingerprint
+
+
+def test_changed_records_are_parsed(app):
+    first = RecordsParser(RECORDS)
+    first.get_all_specials()
+
+    parser = RecordsParser(RECORDS + [{"id": "3", "price": 3000}])
+    parser.previous_fingerprint = first.content_fingerprint
+    specials = parser.get_all_specials()
+    assert set(specials) == {"1", "2", "3"}
+    assert parser.processed == 3
+    assert parser.content_fingerprint != first.content_fingerprint
+
+
+def test_spooled_records_are_parsed_the_same(app):
+    records = [
+        {"id": str(i), "price": 1000 + i, "name": "Résort ✨\n"}
+        for i in range(200)
+    ]
+    forced = RecordsParser(records)
+    forced_specials = forced.get_all_specials()
+
+    # Small enough that the raw specials are written to disk
+    parser = RecordsParser(records)
+    parser.spool_max_size = 1024
+    parser.previous_fingerprint = "0" * 64
+    specials = parser.get_all_specials()
+    assert parser.content_fingerprint == forced.content_fingerprint
+    assert list(specials) == list(forced_specials)
+    for special_id, special in specials.items():
+        assert special.raw_data == forced_specials[special_id].raw_data
+        assert special.raw_string == forced_specials[special_id].raw_string
+
+
+def split_every(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+PAGE = (
+    '<html><script id="reservations">\n'
+    'var all_reservations = [{"id": 1}];\n'
+    "var other = 2;\n</script></html>"
+)
+
+
+@pytest.mark.parametrize("size", range(1, len(PAGE) + 1))
+def test_iter_section_markers_split_between_chunks(size):
+    chunks = split_every(PAGE, size)
+    section = "".join(
+        iter_section(
+            chunks,
+            ('<script id="reservations">', "var all_reservations = "),
+            ";\n",
+        )
+    )
+    assert section == '[{"id": 1}]'
+
+
+def test_iter_section_stops_reading_at_end_marker():
+    read = []
+
+    def chunks():
+        for chunk in split_every(PAGE, 8):
+            read.append(chunk)
+            yield chunk
+
+    section = "".join(iter_section(chunks(), ("all_reservations = ",), ";\n"))
+    assert section == '[{"id": 1}]'
+    assert "".join(read) != PAGE
+
+
+def test_iter_section_missing_marker_raises():
+    with pytest.raises(RuntimeError):
+        "".join(iter_section([PAGE[:60]], ("all_reservations = ",), ";\n"))
+    with pytest.raises(RuntimeError):
+        "".join(iter_section([PAGE], ("all_specials = ",), ";\n"))
+
+
+ARRAY = (
+    '[{"name": "Room ] with, \\"quotes\\"", "points": [12345, -6.5e-3]},'
+    ' "a,]\\\\", 1234567, true, null, [], {}, 0.125]'
+)
+
+
+@pytest.mark.parametrize("size", range(1, len(ARRAY) + 1))
+def test_iter_json_array_split_between_chunks(size):
+    assert list(iter_json_array(split_every(ARRAY, size))) == json.loads(ARRAY)
+
+
+@pytest.mark.parametrize("text", ["[]", " [ ] ", "[\n]"])
+def test_iter_json_array_empty(text):
+    for size in range(1, len(text) + 1):
+        assert list(iter_json_array(split_every(text, size))) == []
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "[",
+        '[{"id": 1}',
+        '[{"id": 1},',
+        '[{"id": 1}, {"id":',
+        '[{"id": 1}, "unterminated',
+        "[1, 2",
+        "[1 2]",
+        '{"id": 1}',
+    ],
+)
+def test_iter_json_array_truncated_or_invalid_raises(text):
+    for size in range(1, len(text) + 2):
+        with pytest.raises(ValueError):
+            list(iter_json_array(split_every(text, size)))